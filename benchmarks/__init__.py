@@ -0,0 +1,2 @@
+__all__ = ['fake_api', 'run_benchmarks', 'check_startup', 'bench_apple_music_parser', 'bench_normalize',
+           'bench_track_table', 'bench_catalog_index']
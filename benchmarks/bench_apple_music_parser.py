@@ -0,0 +1,87 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+from benchmarks import run_benchmarks
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SIZES = (10000, 50000)
+PARSERS = ("beautifulsoup", "streaming")
+
+
+def beautifulsoup_parse(html_file):
+    """
+    The parser ApplePlaylistReader replaced: one full BeautifulSoup tree for the rows and another for the <h1>
+    """
+    import bs4
+    with open(html_file, 'r', encoding="utf-8") as inp:
+        soup = bs4.BeautifulSoup(inp, 'lxml')
+        songs = []
+        for row in soup.find_all("div", class_="songs-list-row"):
+            songs.append({
+                "song": row.find("div", class_="songs-list__col--song").find("div", class_="songs-list-row__song-name").text,
+                "artist": row.find("div", class_="songs-list__col--secondary").find("span").text
+            })
+    with open(html_file, 'r', encoding="utf-8") as inp:
+        title = bs4.BeautifulSoup(inp, 'lxml').find("h1").text
+    return songs, title
+
+
+def streaming_parse(html_file):
+    from src.convert import apmusic_to_spotify
+    reader = apmusic_to_spotify.ApplePlaylistReader(html_file)
+    songs = list(reader)
+    return songs, reader.title
+
+
+def run_child(parser, html_file):
+    """
+    Parses html_file with parser in this process and prints wall time, peak RSS and what was parsed
+    """
+    parse = beautifulsoup_parse if parser == "beautifulsoup" else streaming_parse
+    started = time.perf_counter()
+    songs, title = parse(html_file)
+    wall = time.perf_counter() - started
+    print(json.dumps({"wall_seconds": wall, "peak_rss_mb": run_benchmarks.peak_rss_mb(), "songs": len(songs),
+                      "title": title, "last": songs[-1] if songs else None}))
+
+
+def measure(parser, html_file):
+    # a fresh interpreter per parser, so the peak RSS of one does not hide the other's
+    process = subprocess.run([sys.executable, "-m", "benchmarks.bench_apple_music_parser", "--child", parser,
+                              html_file], cwd=ROOT, env=dict(os.environ, PYTHONPATH=ROOT),
+                             capture_output=True, text=True, check=True)
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Compares the streaming Apple Music page parser with the former two BeautifulSoup passes")
+    parser.add_argument('--sizes', default=",".join(map(str, SIZES)), help="Comma separated songs-list-row counts")
+    parser.add_argument('--child', nargs=2, metavar=("PARSER", "HTML_FILE"), help=argparse.SUPPRESS)
+    options = parser.parse_args(argv)
+    if options.child:
+        return run_child(*options.child)
+
+    failed = False
+    print(f"{'rows':>8}{'file MB':>9}  {'parser':<15}{'wall s':>8}{'rows/s':>10}{'peak MB':>9}")
+    with tempfile.TemporaryDirectory(prefix="analyzer-bench-") as workdir:
+        for size in map(int, options.sizes.split(",")):
+            html_file = os.path.join(workdir, f"apple{size}.html")
+            run_benchmarks.write_apple_music_html(html_file, size)
+            file_mb = os.path.getsize(html_file) / 1024 ** 2
+            results = {name: measure(name, html_file) for name in PARSERS}
+            for name, result in results.items():
+                print(f"{size:>8}{file_mb:>9.1f}  {name:<15}{result['wall_seconds']:>8.2f}"
+                      f"{size / result['wall_seconds']:>10.0f}{run_benchmarks._format(result['peak_rss_mb'], 1):>9}")
+            if len({(result['songs'], result['title'], json.dumps(result['last'])) for result in results.values()}) != 1:
+                print(f"    the parsers disagree on {size} rows")
+                failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,100 @@
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from benchmarks import run_benchmarks
+from src.catalog import catalog_index
+
+SIZE = 1000000
+QUERIES = 2000
+ARTISTS = 50000
+# consonant, vowel and optional coda, about 1300 syllables, so names spread over trigrams the way real ones do
+SYLLABLES = tuple(onset + vowel + coda for onset in ("", "b", "ch", "d", "f", "g", "h", "j", "k", "l", "m", "n", "p",
+                                                      "r", "s", "sh", "t", "v", "w", "z", "br", "st", "tr")
+                  for vowel in ("a", "e", "i", "o", "u", "ai", "ou") for coda in ("", "n", "r", "l", "s", "t", "ng", "ck"))
+
+
+def word(rng):
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 3))).capitalize()
+
+
+def phrase(rng, low, high):
+    return " ".join(word(rng) for _ in range(rng.randint(low, high)))
+
+
+def synthetic_tracks(size, seed=0):
+    """
+    size search result shaped tracks with made up multi word names over ARTISTS artists
+    """
+    rng = random.Random(seed)
+    artists = [phrase(rng, 1, 2) for _ in range(ARTISTS)]
+    for number in range(size):
+        yield {
+            "id": f"track{number}",
+            "name": phrase(rng, 1, 4),
+            "artists": [{"name": artists[rng.randrange(ARTISTS)]}],
+            "album": {"name": phrase(rng, 1, 3)},
+            "duration_ms": 120000 + rng.randrange(240000),
+            "external_ids": {}
+        }
+
+
+def percentile(timings, share):
+    return sorted(timings)[min(len(timings) - 1, int(len(timings) * share))]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Times building and querying a catalog index of synthetic tracks")
+    parser.add_argument('--size', type=int, default=SIZE, help="Number of tracks to index")
+    parser.add_argument('--queries', type=int, default=QUERIES,
+                        help="Number of lookups, half of indexed tracks and half of tracks that are not in the index")
+    options = parser.parse_args(argv)
+
+    rng = random.Random(1)
+    picked = set(rng.sample(range(options.size), options.queries // 2))
+    known = []
+
+    def tracks():
+        for track in synthetic_tracks(options.size):
+            if int(track['id'][len("track"):]) in picked:
+                known.append(track)
+            yield track
+
+    with tempfile.TemporaryDirectory(prefix="analyzer-bench-") as workdir:
+        path = os.path.join(workdir, "catalog.idx")
+        started = time.perf_counter()
+        indexed = catalog_index.build_index(tracks(), path)
+        build_seconds = time.perf_counter() - started
+        print(f"Built {indexed} tracks in {build_seconds:.1f}s ({indexed / build_seconds:.0f} tracks/s), "
+              f"{os.path.getsize(path) / 1024 ** 2:.0f}MB on disk, "
+              f"peak RSS {run_benchmarks._format(run_benchmarks.peak_rss_mb(), 0)}MB")
+
+        started = time.perf_counter()
+        index = catalog_index.CatalogIndex(path)
+        print(f"Opened in {(time.perf_counter() - started) * 1000:.2f}ms")
+
+        # tracks generated with another seed share the vocabulary but are not in the index
+        unknown = list(synthetic_tracks(options.queries - len(known), seed=2))
+        failed = False
+        for label, queried, expect_hit in (("indexed", known, True), ("not indexed", unknown, False)):
+            timings = []
+            hits = 0
+            for track in queried:
+                text = catalog_index.track_text(track)
+                started = time.perf_counter()
+                results = index.search(text)
+                timings.append(time.perf_counter() - started)
+                hits += any(result['id'] == track['id'] for result in results) if expect_hit else bool(results)
+            print(f"{label:<12} {len(queried):>5} queries: p50 {percentile(timings, 0.5) * 1000:.2f}ms, "
+                  f"p95 {percentile(timings, 0.95) * 1000:.2f}ms, p99 {percentile(timings, 0.99) * 1000:.2f}ms, "
+                  f"{hits} {'found' if expect_hit else 'with (near miss) results'}")
+            if expect_hit and hits < len(queried):
+                failed = True
+        index.close()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,121 @@
+import sys
+import time
+import random
+import argparse
+from src.convert import normalize
+
+SIZE = 100000
+YOUTUBE_SUFFIXES = ("", " (Official Video)", " [Official Music Video]", " | Lyrics", " 【MV】", " (Audio) HQ",
+                    " (Color Coded Lyrics)", " (Official Lyric Video)")
+APPLE_MUSIC_SUFFIXES = ("", " (feat. Guest)", " [Remastered 2011]", " (Radio Edit)", " (Bonus Track)",
+                        " (Live at Wembley)")
+
+
+def youtube_videos(size, rng):
+    videos = []
+    for number in range(size):
+        auto_generated = rng.random() < 0.3
+        title = f"Song {number}" if auto_generated else \
+            f"Artist {number % 997} - Song {number}{rng.choice(YOUTUBE_SUFFIXES)}"
+        videos.append((title, f"Artist {number % 997} - Topic" if auto_generated else f"Artist {number % 997}",
+                       auto_generated))
+    return videos
+
+
+def apple_music_rows(size, rng):
+    return [{"song": f"Song {number}: Part {number % 7}{rng.choice(APPLE_MUSIC_SUFFIXES)}",
+             "artist": f"Artist {number % 997} & Friend, Other"} for number in range(size)]
+
+
+def loop_youtube_queries(videos):
+    """
+    The per title str.replace loop normalize.youtube_queries replaced
+    """
+    remove_strings = ['MV', 'Official Music Video', 'Official Video', 'Official Lyric Video', 'Official HD Video',
+                      'Official Audio', 'LyricVideo', 'MusicVideo', 'Audio', 'Video', 'HD', 'Original Song', 'HQ',
+                      'Color Coded', '()', '[]', '【 】', '（）', '( )', '[ ]', '【  】', '（ ）', 'From', 'Lyrics',
+                      '|「 ', '」', '『 ', '』', '【', '】']
+    remove_strings += [remove_string.upper() for remove_string in remove_strings]
+    queries = []
+    for title, channel_title, auto_generated in videos:
+        if auto_generated:
+            query = f'{title} - {channel_title.replace(" - Topic", "")}'
+        else:
+            for remove_string in remove_strings:
+                title = title.replace(remove_string, "")
+            query = title
+        queries.append(query[:69] if len(query) > 120 else query)
+    return queries
+
+
+def loop_apple_music_queries(ap_items):
+    """
+    The per song flag list rebuild and character loops normalize.apple_music_queries replaced
+    """
+    queries = []
+    for ap_item in ap_items:
+        song_name = ap_item['song']
+        flag_strings = ['feat.', 'ft.', 'with', 'from', 'remaster', 'bonus', 'single', "radio", "interlude",
+                        "enterlude", "mixed"]
+        flag_strings += [flag_string.upper() for flag_string in flag_strings]
+        flag_strings += [flag_string.capitalize() for flag_string in flag_strings]
+        for flag_string in flag_strings:
+            first_parenthesis = song_name.find("(")
+            second_parenthesis = song_name.find(")")
+            first_bracket = song_name.find("[")
+            second_bracket = song_name.find("]")
+            if -1 not in (first_parenthesis, second_parenthesis):
+                if flag_string in song_name[first_parenthesis + 1:second_parenthesis]:
+                    song_name = song_name[:song_name.find("(")] + song_name[song_name.find(")") + 1:]
+                    break
+            if -1 not in (first_bracket, second_bracket):
+                if flag_string in song_name[first_bracket + 1:second_bracket]:
+                    song_name = song_name[:first_bracket] + song_name[second_bracket + 1:]
+                    break
+        for bad_character in ["'", '"', ":", "&", "?"]:
+            song_name = song_name.replace(bad_character, "")
+        if len(song_name) > 120: song_name = song_name[:69]
+
+        artist_name = ap_item['artist']
+        for bad_character in ["'", '"', ":", "!"]:
+            artist_name = artist_name.replace(bad_character, "")
+        if not artist_name.find("&") == -1:
+            artist_name = artist_name[:artist_name.find("&")]
+        if not artist_name.find(",") == -1:
+            artist_name = artist_name[:artist_name.find(",")]
+        queries.append(f"track:{song_name.strip()} artist:{artist_name}")
+    return queries
+
+
+def best_of(runs, function, argument):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        function(argument)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Times the normalize batch query builders against the per title loops they replaced")
+    parser.add_argument('--size', type=int, default=SIZE, help="Number of titles per source")
+    parser.add_argument('--runs', type=int, default=5, help="Runs per builder, the best one is reported")
+    options = parser.parse_args(argv)
+
+    rng = random.Random(0)
+    cases = (
+        ("youtube", youtube_videos(options.size, rng), loop_youtube_queries, normalize.youtube_queries),
+        ("apple music", apple_music_rows(options.size, rng), loop_apple_music_queries, normalize.apple_music_queries)
+    )
+    print(f"{'source':<13}{'titles':>8}{'loops s':>10}{'normalize s':>13}{'titles/s':>12}{'speedup':>9}")
+    for source, titles, loops, batch in cases:
+        loop_seconds = best_of(options.runs, loops, titles)
+        batch_seconds = best_of(options.runs, batch, titles)
+        print(f"{source:<13}{len(titles):>8}{loop_seconds:>10.3f}{batch_seconds:>13.3f}"
+              f"{len(titles) / batch_seconds:>12.0f}{loop_seconds / batch_seconds:>8.1f}x")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
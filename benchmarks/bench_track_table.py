@@ -0,0 +1,95 @@
+import gc
+import sys
+import time
+import argparse
+from src.convert import track_table
+
+SIZES = (1000, 5000, 10000, 20000)
+PAGE_SIZE = 50
+# the share of songs the review replaces and removes, every REPLACE_EVERY-th and REMOVE_EVERY-th video
+REPLACE_EVERY = 10
+REMOVE_EVERY = 20
+
+
+def reviewed_keys(size, every):
+    return {f"video{number}" for number in range(0, size, every)}
+
+
+def pages(size):
+    return [[{"key": f"video{number}"} for number in range(start, min(size, start + PAGE_SIZE))]
+            for start in range(0, size, PAGE_SIZE)]
+
+
+def list_conversion(size):
+    """
+    The list handling TrackTable replaced: pages prepended to the whole list, replacements found with index() and
+    spliced in with a rebuilt list, removals with remove()
+    """
+    playlist_items = []
+    for page in pages(size):
+        playlist_items = page + playlist_items
+    items = list(reversed(playlist_items))
+    songs = [{"key": item['key'], "name": item['key']} for item in items]
+    replaced, removed = reviewed_keys(size, REPLACE_EVERY), reviewed_keys(size, REMOVE_EVERY)
+    for song in [song for song in songs if song['key'] in replaced]:
+        index = songs.index(song)
+        songs = songs[:index] + [{"key": song['key'], "name": "replacement"}] + songs[index + 1:]
+    for song in [song for song in songs if song['key'] in removed]:
+        songs.remove(song)
+    return [song['name'] for song in songs]
+
+
+def table_conversion(size):
+    items = [item for page in pages(size) for item in page]
+    songs = track_table.TrackTable([item['key'] for item in items])
+    for item in items:
+        songs.put(item['key'], {"name": item['key']})
+    replaced, removed = reviewed_keys(size, REPLACE_EVERY), reviewed_keys(size, REMOVE_EVERY)
+    for item in items:
+        if item['key'] in replaced:
+            songs.put(item['key'], {"name": "replacement"})
+    for item in items:
+        if item['key'] in removed:
+            songs.remove(item['key'])
+    return [song['name'] for song in songs]
+
+
+def best_of(runs, function, size):
+    timings = []
+    # as timeit does, the cyclic gc's passes over every live dict would otherwise add their own growth
+    gc.disable()
+    try:
+        for _ in range(runs):
+            started = time.perf_counter()
+            result = function(size)
+            timings.append(time.perf_counter() - started)
+    finally:
+        gc.enable()
+    return min(timings), result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Shows TrackTable conversion state scaling linearly with the playlist size, unlike the lists "
+                    "it replaced")
+    parser.add_argument('--sizes', default=",".join(map(str, SIZES)), help="Comma separated playlist sizes")
+    parser.add_argument('--runs', type=int, default=3, help="Runs per size, the best one is reported")
+    options = parser.parse_args(argv)
+
+    failed = False
+    print(f"{'items':>8}{'lists s':>10}{'lists us/item':>15}{'table s':>10}{'table us/item':>15}")
+    for size in map(int, options.sizes.split(",")):
+        list_seconds, list_names = best_of(options.runs, list_conversion, size)
+        table_seconds, table_names = best_of(options.runs, table_conversion, size)
+        # constant time per item is linear scaling
+        print(f"{size:>8}{list_seconds:>10.3f}{list_seconds / size * 10 ** 6:>15.2f}"
+              f"{table_seconds:>10.3f}{table_seconds / size * 10 ** 6:>15.2f}")
+        # the lists reversed each page's items along with the page order, only what survives is compared
+        if sorted(list_names) != sorted(table_names):
+            print(f"    the table and the lists disagree at {size} items")
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,64 @@
+import os
+import sys
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# what the top level cli must not load before a subcommand runs
+HEAVY_MODULES = ("googleapiclient", "google_auth_oauthlib", "spotipy", "lxml", "bs4", "requests")
+DEFAULT_THRESHOLD_MS = 150
+
+
+def import_times(code):
+    """
+    Cumulative import time in microseconds of every top level module `python -X importtime -c code` loads
+    Raises RuntimeError with the rest of stderr when code fails
+    """
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, capture_output=True,
+                             text=True, env=dict(os.environ, PYTHONPATH=ROOT))
+    times = {}
+    errors = []
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:"):
+            errors.append(line)
+        elif "cumulative" not in line:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            times[name.strip()] = int(cumulative)
+    if process.returncode != 0:
+        raise RuntimeError("\n".join(errors[-20:]))
+    return times
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fails when the analyzer cli gets slow to start")
+    parser.add_argument('--threshold-ms', type=float, default=DEFAULT_THRESHOLD_MS,
+                        help="Maximum import time of src.main, best of --runs")
+    parser.add_argument('--runs', type=int, default=5, help="Number of fresh interpreters to time")
+    options = parser.parse_args(argv)
+
+    # --help lists the commands from src.main alone, nothing past it may be imported
+    try:
+        runs = [import_times("from src.main import cli; cli.main(['--help'], standalone_mode=False)")
+                for _ in range(options.runs)]
+    except RuntimeError as e:
+        print(f"analyzer --help failed:\n{e}")
+        return 1
+    if any("src.main" not in times for times in runs):
+        print("src.main was not imported, the check has nothing to time")
+        return 1
+    best_ms = min(times["src.main"] for times in runs) / 1000
+    heavy = sorted({name for times in runs for name in times if name.split(".")[0] in HEAVY_MODULES})
+
+    print(f"src.main imports in {best_ms:.1f}ms (best of {options.runs}, threshold {options.threshold_ms:.0f}ms)")
+    failed = False
+    if best_ms > options.threshold_ms:
+        print("Startup is above the threshold, run python -X importtime -c \"from src.main import cli\" to see why")
+        failed = True
+    if heavy:
+        print(f"--help imported {', '.join(heavy)}, subcommand dependencies must only load in their command")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,252 @@
+import re
+import json
+import time
+import random
+import threading
+import urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+RESULTS_PER_SEARCH = 9
+YOUTUBE_PAGE_SIZE = 50
+SPOTIFY_PAGE_SIZE = 100
+_NUMBER = re.compile(r"\d+")
+
+
+def spotify_track(number):
+    return {
+        "id": f"track{number}",
+        "uri": f"spotify:track:track{number}",
+        "name": f"Song {number}",
+        "artists": [{"id": f"artist{number}", "name": f"Artist {number}"}],
+        "album": {"id": f"album{number // 10}", "name": f"Album {number // 10}"},
+        "duration_ms": 180000 + number % 60000,
+        "external_ids": {"isrc": f"BENCH{number:07d}"},
+        "popularity": number % 100
+    }
+
+
+def youtube_video(number):
+    """
+    Synthetic playlist video: every third one an auto-generated topic upload, every tenth one with a title that
+    needs a localized lookup, the rest plain music videos
+    """
+    auto_generated = number % 3 == 0
+    return {
+        "id": f"video{number}",
+        "title": f"노래 {number}" if number % 10 == 7 else
+        (f"Song {number}" if auto_generated else f"Artist {number} - Song {number} (Official Video)"),
+        "localized": f"Song {number} (Official Video)",
+        "channel": f"Artist {number} - Topic" if auto_generated else f"Artist {number}",
+        "description": "Provided to YouTube\n\nAuto-generated by YouTube." if auto_generated else "Music video"
+    }
+
+
+class FakeApi(ThreadingHTTPServer):
+    """
+    Local stand-in for the Spotify Web API and YouTube Data API endpoints the analyzer calls, answering with
+    synthetic tracks and videos numbered from 0
+    Every request waits latency seconds first and a rate_limit_ratio share of them is answered with a 429
+    carrying Retry-After: retry_after
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), latency=0.0, rate_limit_ratio=0.0, retry_after=1.0, seed=0):
+        super().__init__(address, Handler)
+        self.latency = latency
+        self.rate_limit_ratio = rate_limit_ratio
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.spotify_playlists = {}
+        self.youtube_playlists = {}
+        self.requests = 0
+        self.rate_limited = 0
+
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def add_spotify_playlist(self, playlist_id, size):
+        self.spotify_playlists[playlist_id] = [f"spotify:track:track{number}" for number in range(size)]
+
+    def add_youtube_playlist(self, playlist_id, size):
+        self.youtube_playlists[playlist_id] = size
+
+    def serve_in_background(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def admit(self):
+        """
+        Counts a request and decides whether it gets a 429
+        """
+        with self.lock:
+            self.requests += 1
+            limited = self.random.random() < self.rate_limit_ratio
+            self.rate_limited += limited
+        return not limited
+
+    # spotify
+
+    def search(self, params):
+        query = params.get('q', "")
+        limit = int(params.get('limit', RESULTS_PER_SEARCH))
+        match = _NUMBER.search(query)
+        first = int(match.group()) if match else self.random.randrange(100000)
+        # the searched track first, then neighbours the way a real search mixes in near misses
+        tracks = [spotify_track(first + offset) for offset in range(limit)]
+        return {"tracks": {"items": tracks, "limit": limit, "offset": 0, "total": limit, "next": None}}
+
+    def create_playlist(self, body):
+        with self.lock:
+            playlist_id = f"created{len(self.spotify_playlists)}"
+            self.spotify_playlists[playlist_id] = []
+        return {"id": playlist_id, "name": body.get('name'), "uri": f"spotify:playlist:{playlist_id}"}
+
+    def add_tracks(self, playlist_id, params, body):
+        uris = body if isinstance(body, list) else body.get('uris', [])
+        with self.lock:
+            tracks = self.spotify_playlists.setdefault(playlist_id, [])
+            position = params.get('position')
+            position = len(tracks) if position is None else int(position)
+            tracks[position:position] = uris
+        return {"snapshot_id": f"snapshot{len(tracks)}"}
+
+    def remove_tracks(self, playlist_id, body):
+        # spotipy sends the tracks to remove as "tracks" or, from 2.25 on, "items"
+        removed = {track['uri'] for track in body.get('items') or body.get('tracks') or []}
+        with self.lock:
+            self.spotify_playlists[playlist_id] = [uri for uri in self.spotify_playlists.get(playlist_id, [])
+                                                   if uri not in removed]
+        return {"snapshot_id": "removed"}
+
+    def playlist_items(self, playlist_id, params):
+        offset = int(params.get('offset', 0))
+        limit = int(params.get('limit', SPOTIFY_PAGE_SIZE))
+        uris = self.spotify_playlists.get(playlist_id, [])
+        items = [{"track": spotify_track(int(_NUMBER.search(uri).group()))} for uri in uris[offset:offset + limit]]
+        more = offset + limit < len(uris)
+        return {
+            "items": items,
+            "offset": offset,
+            "limit": limit,
+            "total": len(uris),
+            "next": f"{self.url}/v1/playlists/{playlist_id}/items?offset={offset + limit}&limit={limit}"
+            if more else None
+        }
+
+    # youtube
+
+    def youtube_playlist_items(self, params):
+        size = self.youtube_playlists.get(params.get('playlistId'), 0)
+        start = int(params.get('pageToken') or 0)
+        items = []
+        for number in range(start, min(size, start + YOUTUBE_PAGE_SIZE)):
+            video = youtube_video(number)
+            items.append({
+                "snippet": {
+                    "title": video['title'],
+                    "description": video['description'],
+                    "videoOwnerChannelTitle": video['channel'],
+                    "resourceId": {"videoId": video['id']}
+                },
+                "contentDetails": {"videoId": video['id']}
+            })
+        response = {"etag": f"page-{params.get('playlistId')}-{size}-{start}", "items": items,
+                    "pageInfo": {"totalResults": size, "resultsPerPage": YOUTUBE_PAGE_SIZE}}
+        if start + YOUTUBE_PAGE_SIZE < size:
+            response['nextPageToken'] = str(start + YOUTUBE_PAGE_SIZE)
+        return response
+
+    def youtube_videos(self, params):
+        items = []
+        for video_id in params.get('id', "").split(","):
+            video = youtube_video(int(_NUMBER.search(video_id).group()))
+            items.append({"id": video_id, "snippet": {"title": video['title'],
+                                                      "localized": {"title": video['localized']}}})
+        return {"etag": "videos", "items": items}
+
+    def youtube_playlists_list(self, params):
+        playlist_id = params.get('id')
+        return {"etag": "playlists", "items": [
+            {"id": playlist_id, "snippet": {"title": f"Benchmark {playlist_id}", "description": "Synthetic"}}
+        ]}
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body go out in separate writes, with Nagle on each keep-alive response waits on a delayed ack
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=None, headers=()):
+        data = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        data = self.rfile.read(length) if length else b""
+        if not data:
+            return {}
+        if self.headers.get('Content-Type', "").startswith("application/x-www-form-urlencoded"):
+            return dict(urllib.parse.parse_qsl(data.decode()))
+        return json.loads(data)
+
+    def _handle(self, method):
+        api = self.server
+        url = urllib.parse.urlparse(self.path)
+        path = url.path.rstrip("/")
+        params = dict(urllib.parse.parse_qsl(url.query))
+        body = self._body() if method in ("POST", "PUT", "DELETE") else None
+        if api.latency:
+            time.sleep(api.latency)
+        if not api.admit():
+            return self._send(429, {"error": {"status": 429, "message": "API rate limit exceeded"}},
+                              [("Retry-After", str(api.retry_after))])
+
+        parts = path.strip("/").split("/")
+        if path == "/api/token":
+            return self._send(200, {"access_token": "bench", "token_type": "Bearer", "expires_in": 3600,
+                                    "scope": body.get('scope', "")})
+        if path == "/v1/search":
+            return self._send(200, api.search(params))
+        if path == "/v1/me":
+            return self._send(200, {"id": "bench-user", "display_name": "Benchmark"})
+        if parts[:2] == ["v1", "users"] and parts[-1] == "playlists" and method == "POST":
+            return self._send(201, api.create_playlist(body))
+        # spotipy sends playlist items to /tracks or, from 2.25 on, /items
+        if parts[:2] == ["v1", "playlists"] and len(parts) == 4 and parts[3] in ("tracks", "items"):
+            if method == "POST":
+                return self._send(201, api.add_tracks(parts[2], params, body))
+            if method == "DELETE":
+                return self._send(200, api.remove_tracks(parts[2], body))
+            return self._send(200, api.playlist_items(parts[2], params))
+        if path == "/youtube/v3/playlistItems":
+            return self._send(200, api.youtube_playlist_items(params))
+        if path == "/youtube/v3/videos":
+            return self._send(200, api.youtube_videos(params))
+        if path == "/youtube/v3/playlists":
+            return self._send(200, api.youtube_playlists_list(params))
+        return self._send(404, {"error": {"status": 404, "message": f"No fake for {method} {path}"}})
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
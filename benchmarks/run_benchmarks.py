@@ -0,0 +1,161 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+from html import escape
+from benchmarks import fake_api
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SIZES = (100, 1000, 10000)
+COMMANDS = ("convert-yt-to-spotify", "convert-ap-to-spotify", "export-spotify-playlist")
+
+
+def write_tokens(workdir):
+    """
+    Cached Spotify and YouTube tokens valid for years, so neither login flow runs against the fake
+    """
+    with open(os.path.join(workdir, ".cache"), 'w') as outp:
+        json.dump({"access_token": "bench", "token_type": "Bearer", "expires_in": 3600,
+                   "expires_at": int(time.time()) + 10 ** 8, "refresh_token": "bench",
+                   "scope": "user-library-read playlist-modify-private"}, outp)
+    with open(os.path.join(workdir, ".youtubetoken.json"), 'w') as outp:
+        json.dump({"token": "bench", "refresh_token": "bench", "client_id": "bench", "client_secret": "bench",
+                   "token_uri": "http://127.0.0.1/token", "scopes": ["https://www.googleapis.com/auth/youtube.readonly"],
+                   "expiry": "2099-01-01T00:00:00Z"}, outp)
+
+
+def write_apple_music_html(path, size):
+    """
+    Saved apple music playlist page with size songs-list-row entries, in the markup ApplePlaylistReader reads
+    """
+    with open(path, 'w', encoding="utf-8") as outp:
+        outp.write(f'<html><head><title>Benchmark</title></head><body><h1>Benchmark {size}</h1><div>')
+        for number in range(size):
+            song = f"Song {number} (feat. Guest {number})" if number % 5 == 0 else f"Song {number}"
+            outp.write(f'<div class="songs-list-row"><div class="songs-list__col--song">'
+                       f'<div class="songs-list-row__song-name">{escape(song)}</div></div>'
+                       f'<div class="songs-list__col--secondary"><span>Artist {number}</span></div></div>\n')
+        outp.write('</div></body></html>')
+
+
+def command_args(command, size, workdir, api, rate):
+    """
+    Non-interactive cli arguments benchmarking command at size tracks, with the fake data it needs set up
+    """
+    if command == "convert-yt-to-spotify":
+        playlist_id = f"youtube{size}"
+        api.add_youtube_playlist(playlist_id, size)
+        return [command, playlist_id, "--batch", "--no-cache", "--rate", str(rate), "--youtube-rate", str(rate)]
+    if command == "convert-ap-to-spotify":
+        html_file = os.path.join(workdir, f"apple{size}.html")
+        write_apple_music_html(html_file, size)
+        return [command, html_file, "--batch", "--no-cache", "--rate", str(rate)]
+    playlist_id = f"spotify{size}"
+    api.add_spotify_playlist(playlist_id, size)
+    return [command, playlist_id, "--format", "ndjson", "--rate", str(rate)]
+
+
+def peak_rss_mb():
+    """
+    Peak resident memory of this process in MB, None where the resource module is missing (windows)
+    """
+    if not resource:
+        return None
+    # kilobytes on linux, bytes on macos
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 ** 2 if sys.platform == "darwin" else 1024)
+
+
+def run_child(args):
+    """
+    Runs one cli invocation in this process and prints its wall time and peak RSS as the last line
+    """
+    from src.main import cli
+    started = time.perf_counter()
+    error = None
+    try:
+        cli.main(args, prog_name="analyzer", standalone_mode=False)
+    except Exception as e:
+        error = repr(e)
+    wall = time.perf_counter() - started
+    print(json.dumps({"wall_seconds": wall, "peak_rss_mb": peak_rss_mb(), "error": error}))
+
+
+def benchmark(command, size, api, rate):
+    with tempfile.TemporaryDirectory(prefix="analyzer-bench-") as workdir:
+        write_tokens(workdir)
+        args = command_args(command, size, workdir, api, rate)
+        env = dict(os.environ, PYTHONPATH=ROOT, SPOTIFY_CLIENT_ID="bench", SPOTIFY_CLIENT_SECRET="bench",
+                   SPOTIFY_API_URL=f"{api.url}/v1/", YOUTUBE_API_URL=f"{api.url}/")
+        requests_before, limited_before = api.requests, api.rate_limited
+        process = subprocess.run([sys.executable, "-m", "benchmarks.run_benchmarks", "--child", "--", *args],
+                                 cwd=workdir, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        output = process.stdout.strip().splitlines()
+        try:
+            result = json.loads(output[-1])
+        except (IndexError, json.JSONDecodeError):
+            result = {"wall_seconds": None, "peak_rss_mb": None, "error": "\n".join(output[-20:])}
+
+    result.update({
+        "command": command,
+        "tracks": size,
+        "tracks_per_second": size / result['wall_seconds'] if result['wall_seconds'] else None,
+        "requests": api.requests - requests_before,
+        "rate_limited": api.rate_limited - limited_before
+    })
+    return result
+
+
+def _format(value, digits):
+    return "-" if value is None else f"{value:.{digits}f}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Runs the converters and the export end to end against a local fake Spotify and YouTube api")
+    parser.add_argument('--sizes', default=",".join(map(str, SIZES)), help="Comma separated track counts")
+    parser.add_argument('--commands', default=",".join(COMMANDS), help="Comma separated commands to run")
+    parser.add_argument('--latency', type=float, default=0.02, help="Seconds every fake api response is delayed")
+    parser.add_argument('--rate-limit-ratio', type=float, default=0.0, help="Share of requests answered with a 429")
+    parser.add_argument('--retry-after', type=float, default=1.0, help="Retry-After seconds of the injected 429s")
+    parser.add_argument('--rate', type=float, default=1000.0, help="--rate (and --youtube-rate) given to the commands")
+    parser.add_argument('--output', default=None, help="Also write the results to this json file")
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('args', nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
+    options = parser.parse_args(argv)
+    if options.child:
+        return run_child([arg for arg in options.args if arg != "--"])
+
+    api = fake_api.FakeApi(latency=options.latency, rate_limit_ratio=options.rate_limit_ratio,
+                           retry_after=options.retry_after)
+    api.serve_in_background()
+    results = []
+    print(f"{'command':<26}{'tracks':>8}{'wall s':>10}{'tracks/s':>10}{'peak MB':>10}{'requests':>10}{'429s':>7}")
+    try:
+        for size in map(int, options.sizes.split(",")):
+            for command in options.commands.split(","):
+                result = benchmark(command, size, api, options.rate)
+                results.append(result)
+                print(f"{command:<26}{size:>8}{_format(result['wall_seconds'], 2):>10}"
+                      f"{_format(result['tracks_per_second'], 0):>10}{_format(result['peak_rss_mb'], 1):>10}"
+                      f"{result['requests']:>10}{result['rate_limited']:>7}", flush=True)
+                if result['error']:
+                    print(f"    failed: {result['error']}")
+    finally:
+        api.shutdown()
+
+    if options.output:
+        with open(options.output, 'w') as outp:
+            json.dump(results, outp, indent=4)
+    return 1 if any(result['error'] for result in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,155 @@
+import os
+import re
+import mmap
+import json
+import click
+import struct
+from glob import glob
+from array import array
+from bisect import bisect_left
+from zlib import crc32
+from collections import Counter
+from src.convert import exact_match
+
+MAGIC = b"SPCATIX1"
+HEADER = struct.Struct("<8sII5Q")
+DEFAULT_MIN_SCORE = 0.75
+# only the rarest query trigrams are used to collect candidates, the rest only take part in scoring
+CANDIDATE_TRIGRAMS = 12
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def normalize_text(text):
+    return " ".join(_NON_WORD.sub(" ", text.lower()).split())
+
+
+def trigrams(text):
+    padded = f"  {normalize_text(text)} "
+    return {crc32(padded[i:i + 3].encode("utf-8")) for i in range(len(padded) - 2)}
+
+
+def track_text(track):
+    return f"{track['name']} {track['artists'][0]['name']}"
+
+
+def build_index(tracks, path):
+    """
+    Writes tracks (search result shaped dicts) to a trigram index file at path and returns the number indexed
+    Layout after the header, each section 8 byte aligned: track offsets, track json, sorted trigram keys,
+    postings offsets, postings
+    """
+    offsets = array('Q', [0])
+    data = bytearray()
+    postings = {}
+    seen = set()
+    for track in tracks:
+        if track['id'] in seen:
+            continue
+        seen.add(track['id'])
+        track_id = len(offsets) - 1
+        for key in trigrams(track_text(track)):
+            postings.setdefault(key, array('I')).append(track_id)
+        data += json.dumps(track, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+        offsets.append(len(data))
+
+    keys = array('I', sorted(postings))
+    postings_offsets = array('Q', [0])
+    for key in keys:
+        postings_offsets.append(postings_offsets[-1] + len(postings[key]))
+
+    with open(path, 'wb') as outp:
+        positions = []
+        outp.seek(HEADER.size)
+        for section in (offsets, data, keys, postings_offsets):
+            outp.write(b"\0" * (-outp.tell() % 8))
+            positions.append(outp.tell())
+            outp.write(section)
+        outp.write(b"\0" * (-outp.tell() % 8))
+        positions.append(outp.tell())
+        for key in keys:
+            postings[key].tofile(outp)
+        outp.seek(0)
+        outp.write(HEADER.pack(MAGIC, len(offsets) - 1, len(keys), *positions))
+
+    return len(offsets) - 1
+
+
+class CatalogIndex:
+    """
+    Read side of a catalog index file, memory mapped so opening it costs nothing and pages load on demand
+    """
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.track_count, trigram_count, offsets_pos, data_pos, keys_pos, postings_offsets_pos, postings_pos = \
+            HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a catalog index")
+        view = memoryview(self._mmap)
+        self._offsets = view[offsets_pos:offsets_pos + (self.track_count + 1) * 8].cast('Q')
+        self._data = view[data_pos:data_pos + self._offsets[-1]]
+        self._keys = view[keys_pos:keys_pos + trigram_count * 4].cast('I')
+        self._postings_offsets = view[postings_offsets_pos:postings_offsets_pos + (trigram_count + 1) * 8].cast('Q')
+        self._postings = view[postings_pos:postings_pos + self._postings_offsets[-1] * 4].cast('I')
+
+    def _posting(self, key):
+        position = bisect_left(self._keys, key)
+        if position == len(self._keys) or self._keys[position] != key:
+            return None
+        return self._postings[self._postings_offsets[position]:self._postings_offsets[position + 1]]
+
+    def track(self, track_id):
+        return json.loads(bytes(self._data[self._offsets[track_id]:self._offsets[track_id + 1]]))
+
+    def search(self, text, limit=9, min_score=DEFAULT_MIN_SCORE):
+        """
+        Tracks whose name and first artist are most similar to text (dice coefficient over trigrams),
+        best first, in the same shape as sp.search track items
+        """
+        query = trigrams(text)
+        postings = sorted((posting for posting in map(self._posting, query) if posting is not None), key=len)
+        candidates = Counter()
+        for posting in postings[:CANDIDATE_TRIGRAMS]:
+            candidates.update(posting.tolist())
+
+        scored = []
+        for track_id, _ in candidates.most_common(limit * 4):
+            track = self.track(track_id)
+            track_trigrams = trigrams(track_text(track))
+            score = 2 * len(query & track_trigrams) / (len(query) + len(track_trigrams))
+            if score >= min_score:
+                scored.append((score, track))
+        scored.sort(key=lambda pair: pair[0], reverse=True)
+        return [track for _, track in scored[:limit]]
+
+    def close(self):
+        for view in (self._offsets, self._data, self._keys, self._postings_offsets, self._postings):
+            view.release()
+        self._mmap.close()
+        self._file.close()
+
+
+@click.command()
+@click.option('--output', '-o', default="catalog.idx", show_default=True, help="Index file to write")
+@click.argument('exports', nargs=-1, required=True)
+def build_catalog_index(exports, output):
+    """
+    Builds a local search index from export-spotify-playlist outputs (files or directories of them)
+    The converters query it with --catalog-index before searching on Spotify
+    """
+    paths = []
+    for export in exports:
+        if os.path.isdir(export):
+            paths += glob(os.path.join(export, "*-spotify-tracks.json"))
+            paths += glob(os.path.join(export, "*-spotify-tracks.ndjson"))
+        else:
+            paths.append(export)
+
+    def tracks():
+        with click.progressbar(paths, label="Reading exports") as bar:
+            for path in bar:
+                yield from exact_match.iter_export_tracks(path)
+
+    click.echo(f"Indexed {build_index(tracks(), output)} tracks into {output}")
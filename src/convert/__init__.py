@@ -1 +1,2 @@
-__all__ = ["yt_to_spotify", "apmusic_to_spotify"]
+__all__ = ["yt_to_spotify", "apmusic_to_spotify", "normalize", "batch_review", "checkpoint", "review",
+           "track_table", "exact_match", "pipeline", "convert_many", "playlist_sync"]
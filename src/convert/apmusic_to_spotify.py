@@ -1,208 +1,234 @@
 import os
 import pprint
 import click
-import lxml
-import bs4
-from src.spotify import create_spotify_client
+from lxml import etree
+from src.catalog import catalog_index
+from src.convert import normalize, batch_review, checkpoint, review, exact_match, pipeline, playlist_sync
+from src.export import export_spotify_playlist
+from src.profiling import profiler
+from src.spotify import create_spotify_client, search_cache, rate_limiter
+
+
+def _has_class(element, class_name):
+    return class_name in (element.get("class") or "").split()
+
+
+def _find_descendant(element, tag, class_name=None):
+    if element is None:
+        return None
+    for descendant in element.iter(tag):
+        if descendant is not element and (class_name is None or _has_class(descendant, class_name)):
+            return descendant
+    return None
+
+
+def _text(element):
+    return "".join(element.itertext()) if element is not None else ""
+
+
+def _row_to_song(row):
+    song_column = _find_descendant(row, "div", "songs-list__col--song")
+    artist_column = _find_descendant(row, "div", "songs-list__col--secondary")
+    return {
+        "song": _text(_find_descendant(song_column, "div", "songs-list-row__song-name")),
+        "artist": _text(_find_descendant(artist_column, "span"))
+    }
+
+
+class ApplePlaylistReader:
+    """
+    Streams a saved apple music playlist page in one pass, yielding songs-list-row entries as they are parsed
+    The playlist <h1> is captured on the way into self.title and finished elements are cleared to keep memory flat
+    """
+
+    def __init__(self, html_file):
+        self.html_file = html_file
+        self.title = None
+
+    def __iter__(self):
+        open_captures = 0
+        with open(self.html_file, 'rb') as inp:
+            for event, element in etree.iterparse(inp, events=("start", "end"), html=True, encoding="utf-8",
+                                                  huge_tree=True):
+                is_row = element.tag == "div" and _has_class(element, "songs-list-row")
+                is_title = element.tag == "h1" and self.title is None
+                if event == "start":
+                    if is_row or is_title:
+                        open_captures += 1
+                    continue
+
+                if is_row:
+                    open_captures -= 1
+                    yield _row_to_song(element)
+                elif is_title:
+                    open_captures -= 1
+                    self.title = _text(element)
+
+                # rows and the title are still being built while a capture is open
+                if open_captures == 0:
+                    element.clear()
+                    while element.getprevious() is not None:
+                        del element.getparent()[0]
+
+
+def apple_music_items(ap_items):
+    """
+    Search pipeline items (see pipeline.search_songs) for the rows of an apple music playlist
+    """
+    return [
+        {
+            "key": checkpoint.apple_music_key(index, ap_item),
+            "query": query,
+            "source": {"title": ap_item['song'], "artist": ap_item['artist']},
+            "identity": {"title": ap_item['song'], "artist": ap_item['artist'], "isrc": None}
+        }
+        for index, (ap_item, query) in enumerate(zip(ap_items, normalize.apple_music_queries(ap_items)))
+    ]
 
 
 def get_apple_music_playlist_items(html_file):
-    with open(html_file, 'r', encoding="utf-8") as out_f:
-        soup = bs4.BeautifulSoup(out_f, 'lxml')
-        rows = soup.find_all("div", class_="songs-list-row")
-        songs = []
-        for row in rows:
-            song = row.find("div", class_="songs-list__col--song").find("div", class_="songs-list-row__song-name").text
-            artist = row.find("div", class_="songs-list__col--secondary").find("span").text
-            songs.append(
-                {
-                    "song": song,
-                    "artist": artist
-                }
-            )
-
-        return songs
+    return list(ApplePlaylistReader(html_file))
 
 
 def get_apple_music_playlist_title(html_file):
-    with open(html_file, 'r', encoding="utf-8") as out_f:
-        soup = bs4.BeautifulSoup(out_f, 'lxml')
-        title = soup.find("h1").text
-        return title
+    reader = ApplePlaylistReader(html_file)
+    for _ in reader:
+        if reader.title is not None:
+            break
+    return reader.title
 
 
 @click.command()
-@click.option('--spotify-client-id', default=os.environ['SPOTIFY_CLIENT_ID'],
+@click.option('--spotify-client-id', envvar='SPOTIFY_CLIENT_ID', required=True,
               help="Default is SPOTIFY_CLIENT_ID env variable")
-@click.option('--spotify-client-secret', default=os.environ['SPOTIFY_CLIENT_SECRET'],
+@click.option('--spotify-client-secret', envvar='SPOTIFY_CLIENT_SECRET', required=True,
               help="Default is SPOTIFY_CLIENT_SECRET env variable")
+@click.option('--concurrency', default=8, show_default=True, help="Number of Spotify searches to run at once")
+@click.option('--rate', default=rate_limiter.SPOTIFY_RATE, show_default=True,
+              help="Maximum Spotify requests per second")
+@click.option('--no-cache', is_flag=True, help="Always send searches to Spotify instead of the local search cache")
+@click.option('--cache-dir', default=search_cache.DEFAULT_CACHE_DIR, show_default=True,
+              help="Directory of the local search cache")
+@click.option('--batch', is_flag=True,
+              help="Skip every prompt, auto-accept matches above --threshold and log the rest to --review-file")
+@click.option('--threshold', default=batch_review.DEFAULT_THRESHOLD, show_default=True,
+              help="Minimum title/artist similarity (0-1) for a match to be accepted in batch mode")
+@click.option('--stream', is_flag=True,
+              help="With --batch, create the playlist first and add accepted songs while the search is still running")
+@click.option('--prefetch-ahead', default=review.DEFAULT_PREFETCH_AHEAD, show_default=True,
+              help="Number of upcoming songs whose fallback searches run in the background during the review")
+@click.option('--prefetch-final-review', is_flag=True,
+              help="Also run fallback searches in the background during the final review, about 3 per song")
+@click.option('--review-file', default=None, help="Batch mode review output, default is <html file name>-review.jsonl")
+@click.option('--exports-dir', default=None,
+              help="Directory of earlier export-spotify-playlist outputs to match against before searching")
+@click.option('--catalog-index', 'catalog_index_file', default=None, type=click.Path(exists=True, dir_okay=False),
+              help="Index from build-catalog-index to look tracks up in before searching on Spotify")
+@click.option('--sync-to', default=None,
+              help="Spotify playlist (id, uri or url) to update in place instead of creating a new one, "
+                   "only items added since the last sync are searched")
+@click.option('--sync-state', 'sync_state_file', default=None,
+              help="Source to track mapping kept between syncs, default is <spotify playlist id>-sync.json")
+@click.option('--profile', is_flag=True, help="Print where the run spent its time and which api calls it made")
+@click.option('--profile-trace', default=None, help="Also write every api call and the profile summary to this json file")
+@click.option('--resume', default=None,
+              help="Checkpoint journal of an interrupted run to continue, new runs write <html file name>-checkpoint.jsonl")
 @click.argument('html_file')
-def convert_ap_to_spotify(html_file, spotify_client_id, spotify_client_secret):
+def convert_ap_to_spotify(html_file, spotify_client_id, spotify_client_secret, concurrency, rate, no_cache,
+                          cache_dir, batch, stream, threshold, review_file, prefetch_ahead, prefetch_final_review,
+                          exports_dir, catalog_index_file, sync_to, sync_state_file, profile, profile_trace,
+                          resume):
     """
     Takes an apple music playlist (from an html or htm file) and converts it into a spotify one
     Make sure to retrieve spotify api credentials
     """
+    if stream and (not batch or sync_to):
+        raise click.UsageError("--stream only works with --batch and without --sync-to")
+    profiler.start(profile, profile_trace)
+    rate_limiter.SPOTIFY.bucket = rate_limiter.TokenBucket(rate)
+
     click.echo("")
     click.echo("Getting Apple Music playlist items     ------------")
-    ap_items = get_apple_music_playlist_items(html_file)
-
-    songs = []
-    not_found_songs = []
-    sp = create_spotify_client.create_spotify_client(spotify_client_id, spotify_client_secret)
-    with click.progressbar(length=len(ap_items), label="Searching on Spotify",
-                           item_show_func=lambda q: q) as bar:
-        for index, ap_item in enumerate(ap_items):
-            song_name = ap_item['song']
-            flag_strings = ['feat.', 'ft.', 'with', 'from', 'remaster', 'bonus', 'single', "radio", "interlude",
-                            "enterlude", "mixed"]
-
-            flag_strings += [flag_string.upper() for flag_string in flag_strings]
-            flag_strings += [flag_string.capitalize() for flag_string in flag_strings]
-
-            for flag_string in flag_strings:
-                first_parenthesis = song_name.find("(")
-                second_parenthesis = song_name.find(")")
-                first_bracket = song_name.find("[")
-                second_bracket = song_name.find("]")
-
-                if not -1 in (first_parenthesis, second_parenthesis):
-                    if flag_string in song_name[first_parenthesis + 1:second_parenthesis]:
-                        song_name = song_name[:song_name.find("(")] + song_name[song_name.find(")") + 1:]
-                        break
-
-                if not -1 in (first_bracket, second_bracket):
-                    if flag_string in song_name[first_bracket + 1:second_bracket]:
-                        song_name = song_name[:first_bracket] + song_name[second_bracket + 1:]
-                        break
-
-            bad_characters = ["'", '"', ":", "&", "?"]
-            for bad_character in bad_characters:
-                song_name = song_name.replace(bad_character, "")
-
-            if len(song_name) > 120: song_name = song_name[:69]
-
-            artist_name = ap_item['artist']
-            bad_characters = ["'", '"', ":", "!"]
-            for bad_character in bad_characters:
-                artist_name = artist_name.replace(bad_character, "")
-
-            if not artist_name.find("&") == -1:
-                artist_name = artist_name[:artist_name.find("&")]
-            if not artist_name.find(",") == -1:
-                artist_name = artist_name[:artist_name.find(",")]
-
-            query = f"track:{song_name.strip()} artist:{artist_name}"
-            response = sp.search(query, type="track", limit=9)
-            try:
-                song = response['tracks']['items'][0]
-                song['query'] = query
-                song['other_results'] = response['tracks']['items']
-                songs.append(song)
-
-                bar.update(1,
-                           f"{index + 1}/{len(ap_items)} {song['name']} - {song['artists'][0]['name']}               ====              {query}")
-            except IndexError:
-                not_found_songs.append({"query": query, })
-                bar.update(1, "     Track not found for " + query)
-
-    click.echo("===================================================================")
-    click.echo(f"Found {len(songs)}/{len(ap_items)}")
-    not_added_songs = []
-    marked_for_removal = []
-    for not_found_song in not_found_songs:
-        click.echo(f"Did not find: {not_found_song['query']}")
-
-        if click.confirm("Would you like to search for this song?", default=True):
-            query = click.prompt(
-                "Input your manuel search query here (Try either a simpler query or a different version)", type=str)
-            searched_songs = sp.search(query, type="track", limit=9)['tracks']['items']
-
-            for index, searched_song in enumerate(searched_songs):
-                click.echo(
-                    f"[{index}] {searched_song['name']} - {searched_song['artists'][0]['name']} - {searched_song['album']['name']}")
+    profiler.mark("reading apple music playlist")
+    ap_playlist = ApplePlaylistReader(html_file)
+    ap_items = list(ap_playlist)
 
-            click.echo(f"[{len(searched_songs)}] Completely Ignore and log")
-            option = click.prompt("Input option number", type=int, default=0)
+    items = apple_music_items(ap_items)
+    profiler.mark("loading exports, catalog and journal")
+    catalog = catalog_index.CatalogIndex(catalog_index_file) if catalog_index_file else None
+    matcher = exact_match.ExactMatcher(exports_dir, catalog)
+    playlist_name = os.path.splitext(os.path.basename(html_file))[0]
+    journal = checkpoint.Checkpoint(resume or f"{playlist_name}-checkpoint.jsonl", resume=bool(resume))
 
-            if not option == len(searched_songs):
-                chosen_song = searched_songs[option]
-                chosen_song['query'] = not_found_song['query']
-                songs.append(chosen_song)
-                marked_for_removal.append(not_found_song)
-            click.echo("\n")
-
-    for marked in marked_for_removal:
-        not_found_songs.remove(marked)
-
-    click.echo("\n")
-    if not click.confirm("Final Review Process (go through each song) skip?", default=False):
-        current_song_index = 0
-        selection_amount = 5
-
-        while True:
-            click.clear()
-            current_selection = songs[current_song_index - selection_amount:current_song_index + selection_amount + 1]
-            for index, song in enumerate(current_selection):
-                song_index = current_song_index - selection_amount + index
-                if index < selection_amount or index > selection_amount:
-                    click.echo(
-                        f"{song_index + 1}/{len(songs)} {song['name']} - {song['artists'][0]['name']}               ====              {song['query']}")
-                else:
-                    click.echo(
-                        f"\n ======= {song_index + 1}/{len(songs)} {song['name']} - {song['artists'][0]['name']}               ====              {song['query']}\n")
-
-            click.echo("\nControls: h for up, j or ENTER for down, m for more options")
-            song = songs[current_song_index]
-            user_input = click.prompt(
-                f"\n{current_song_index + 1}/{len(songs)} {song['name']} | {song['artists'][0]['name']} | {song['album']['name']} - review?",
-                default='j', type=click.Choice(['h', 'j', 'm'], case_sensitive=False), show_choices=True)
-            if user_input == "m":
-                query = click.prompt(
-                    "Input your manuel search query here (Try either a simpler query or a different version)", type=str)
-                searched_songs = sp.search(query, type="track", limit=9)['tracks']['items']
-
-                for i, searched_song in enumerate(searched_songs):
-                    click.echo(
-                        f"[{i}] {searched_song['name']} - {searched_song['artists'][0]['name']} - {searched_song['album']['name']}")
-
-                click.echo(f"[{len(searched_songs)}] Completely Ignore and log")
-                option = click.prompt("Input option number", type=int, default=0)
-
-                if option == len(searched_songs):
-                    songs.remove(song)
-                    not_added_songs.append(song)
-                else:
-                    i = songs.index(song)
-                    chosen_song = searched_songs[option]
-                    chosen_song['query'] = song['query']
-                    songs = songs[:i] + [chosen_song] + songs[i + 1:]
+    sp = create_spotify_client.create_spotify_client(spotify_client_id, spotify_client_secret)
+    sp = search_cache.cached_client(sp, no_cache, cache_dir)
+    sync_state = None
+    if sync_to:
+        sync_to = export_spotify_playlist.parse_playlist_id(sync_to)
+        sync_state = playlist_sync.SyncState(sync_state_file or f"{sync_to}-sync.json", sync_to)
+        click.echo(f"{len(sync_state.new_items(items))} new and {len(sync_state.gone_keys(items))} removed items "
+                   f"since the last sync")
+    search_items = sync_state.new_items(items) if sync_state else items
+    if stream:
+        profiler.mark("spotify search and playlist write")
+        review_file = review_file or f"{playlist_name}-review.jsonl"
+        click.echo("Creating Spotify Playlist...")
+        sp_playlist = pipeline.create_spotify_playlist(sp, ap_playlist.title,
+                                                       f"funee monkey smile: {ap_playlist.title}", [])
+        writer = pipeline.PlaylistWriter(sp, sp_playlist['id'])
+        songs, not_found_songs, not_added_songs, reviewed_songs = pipeline.stream_songs(
+            sp, matcher, journal, search_items, writer, review_file, threshold, concurrency)
+        click.echo("===================================================================")
+        click.echo(f"Accepted {len(songs)}/{len(search_items)} songs, "
+                   f"{len(reviewed_songs) + len(not_found_songs)} written to {review_file}")
+    else:
+        profiler.mark("spotify search")
+        songs, not_found_songs = pipeline.search_songs(sp, matcher, journal, search_items, concurrency)
+
+        click.echo("===================================================================")
+        click.echo(f"Found {len(songs)}/{len(search_items)}")
+        not_found_songs, not_added_songs = journal.apply_decisions(songs, not_found_songs)
+
+    profiler.mark("review")
+    if batch and not stream:
+        review_file = review_file or f"{playlist_name}-review.jsonl"
+        reviewed_songs = batch_review.auto_review(songs, not_found_songs, review_file, threshold, journal)
+        click.echo(f"Accepted {len(songs)} songs, {len(reviewed_songs) + len(not_found_songs)} written to {review_file}")
+    elif not batch:
+        prefetcher = review.Prefetcher(sp, prefetch_ahead)
+        pending_songs = [song for song in not_found_songs if not journal.decided(song['key'])]
+        for index, not_found_song in enumerate(pending_songs):
+            prefetcher.warm(pending_songs, index)
+            click.echo(f"Did not find: {not_found_song['query']}")
+
+            chosen_song = None
+            if click.confirm("Would you like to search for this song?", default=True):
+                chosen_song = review.manual_search(sp, "Completely Ignore and log", not_found_song, prefetcher)
                 click.echo("\n")
-            elif user_input == "h":
-                current_song_index -= 1
-            elif user_input == "j":
-                if current_song_index == len(songs) - 1:
-                    if click.confirm("Are these your final results?", default=False):
-                        break
-                    else:
-                        continue
-                else:
-                    current_song_index += 1
 
-    click.echo("\n===============================")
-    click.echo("Creating Spotify Playlist...")
-    ap_title = get_apple_music_playlist_title(html_file)
-    user_id = sp.me()['id']
-    sp_playlist = sp.user_playlist_create(user_id, ap_title, False, False,
-                                          f"funee monkey smile: {ap_title}")
-    song_ids = [song['id'] for song in songs]
+            if chosen_song is None:
+                journal.decide(not_found_song['key'], "ignore")
+            else:
+                chosen_song = review.carry_over(chosen_song, not_found_song)
+                songs.put(not_found_song['key'], chosen_song)
+                journal.decide(not_found_song['key'], "replace", chosen_song)
+        not_found_songs = [not_found_song for not_found_song in not_found_songs if not_found_song['key'] not in songs]
 
-    def chunker(seq, size):
-        return (seq[pos:pos + size] for pos in range(0, len(seq), size))
+        click.echo("\n")
+        if not click.confirm("Final Review Process (go through each song) skip?", default=False):
+            review.final_review(sp, songs, not_added_songs, journal, prefetcher, prefetch_final_review)
+        prefetcher.close()
+        click.echo(prefetcher.stats())
 
-    with click.progressbar(length=len(songs), label="Adding to Spotify Playlist") as bar:
-        for chunk in chunker(song_ids, 100):
-            sp.user_playlist_add_tracks(user_id, sp_playlist['id'], chunk)
-            bar.update(len(chunk))
+    click.echo("\n===============================")
+    profiler.mark("playlist write")
+    if sync_state:
+        click.echo("Syncing Spotify Playlist...")
+        added_ids, removed_ids = playlist_sync.sync_spotify_playlist(sp, sync_state, items, songs)
+        click.echo(f"Added {len(added_ids)} and removed {len(removed_ids)} tracks")
+    elif not stream:
+        click.echo("Creating Spotify Playlist...")
+        pipeline.create_spotify_playlist(sp, ap_playlist.title, f"funee monkey smile: {ap_playlist.title}", songs)
 
     click.echo("\n===============================")
     for not_added_song in not_added_songs:
@@ -213,3 +239,13 @@ def convert_ap_to_spotify(html_file, spotify_client_id, spotify_client_secret):
     for not_found_song in not_found_songs:
         click.echo(
             f"Did not find: {not_found_song['query']}")
+
+    click.echo(matcher.report())
+    if catalog:
+        catalog.close()
+    journal.close()
+    if not no_cache:
+        click.echo(sp.cache.stats())
+        sp.cache.close()
+    click.echo(f"Spotify: {rate_limiter.SPOTIFY.stats()}")
+    profiler.stop(profile_trace)
@@ -0,0 +1,100 @@
+import re
+import json
+from difflib import SequenceMatcher
+from src.convert import normalize
+from src.convert.review import carry_over
+
+DEFAULT_THRESHOLD = 0.8
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def _clean(string):
+    return _NON_WORD.sub(" ", string.lower()).strip()
+
+
+def similarity(a, b):
+    return SequenceMatcher(None, _clean(a), _clean(b)).ratio()
+
+
+def score_candidate(candidate, title, artist=None):
+    """
+    Scores a spotify track against the source title and artist between 0 and 1
+    Without an artist the title is assumed to carry it, as in most youtube video titles
+    """
+    # spotify appends versions as "Name - Remastered 2015", the source title usually leaves them out
+    name = candidate['name'].split(" - ")[0]
+    candidate_artist = candidate['artists'][0]['name'] if candidate['artists'] else ""
+    if not artist:
+        return max(similarity(title, name),
+                   similarity(title, f"{candidate_artist} {name}"),
+                   similarity(title, f"{name} {candidate_artist}"))
+    return (2 * similarity(title, name) + similarity(artist, candidate_artist)) / 3
+
+
+def _review_record(reason, song, candidates):
+    record = {
+        "reason": reason,
+        "query": song['query'],
+        "source": song.get('source'),
+        "candidates": [
+            {
+                "id": candidate['id'],
+                "name": candidate['name'],
+                "artist": candidate['artists'][0]['name'] if candidate['artists'] else "",
+                "album": candidate['album']['name'],
+                "score": round(score, 3)
+            }
+            for score, candidate in candidates
+        ]
+    }
+    if 'youtube_id' in song:
+        record['youtube_id'] = song['youtube_id']
+    return record
+
+
+def best_match(song, threshold=DEFAULT_THRESHOLD):
+    """
+    Scores every candidate of a searched song, best first
+    Returns the best one (with what the converters attached carried over) when it scores at or above threshold,
+    else None, and the scored candidates
+    """
+    title, artist = song['source']['title'], song['source'].get('artist')
+    if 'youtube_id' in song:
+        # video titles carry noise like "(Official Video)" that no track name has
+        title = normalize.normalize_youtube_title(title)
+    scored = sorted(((score_candidate(candidate, title, artist), candidate)
+                     for candidate in song['other_results']), key=lambda pair: pair[0], reverse=True)
+    score, best = scored[0]
+    return (carry_over(best, song) if score >= threshold else None), scored
+
+
+def write_review(outp, reason, song, scored=()):
+    outp.write(json.dumps(_review_record(reason, song, scored), ensure_ascii=False) + "\n")
+
+
+def auto_review(table, not_found_songs, review_file, threshold=DEFAULT_THRESHOLD, journal=None):
+    """
+    Non-interactive replacement for the review loops
+    Swaps every song in the track table for its best scoring candidate when that scores at or above threshold,
+    everything else is taken out of the table and written to review_file as json lines
+    Songs replaced by hand in a journaled earlier run are taken as they are
+    Returns the songs sent to review
+    """
+    reviewed = []
+    with open(review_file, 'w', encoding="utf-8") as outp:
+        for song in list(table):
+            if journal and journal.decisions.get(song['key'], {}).get('action') == "replace":
+                continue
+            best, scored = best_match(song, threshold)
+            if best is not None:
+                table.put(song['key'], best)
+            else:
+                table.remove(song['key'])
+                reviewed.append(song)
+                write_review(outp, "low_confidence", song, scored)
+
+        for not_found_song in not_found_songs:
+            write_review(outp, "not_found", not_found_song)
+
+    return reviewed
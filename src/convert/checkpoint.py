@@ -0,0 +1,89 @@
+import os
+import json
+from src.spotify import search_executor
+
+
+def youtube_key(index, video_id):
+    return f"{index}:{video_id}"
+
+
+def apple_music_key(index, ap_item):
+    return f"{index}:{ap_item['song']}|{ap_item['artist']}"
+
+
+def _storable(song):
+    # other_results holds every search candidate, drop it so the record stays small
+    return {key: value for key, value in song.items() if key != 'other_results'}
+
+
+class Checkpoint:
+    """
+    Append-only json lines journal of search responses and review decisions keyed by source item
+    Replaying it on --resume skips every search and prompt that already has an answer
+    Decisions are one of keep, replace (with the chosen song), remove or ignore, the last one for a key wins
+    """
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.searches = {}
+        self.decisions = {}
+        if resume and os.path.exists(path):
+            with open(path, 'r', encoding="utf-8") as inp:
+                for line in inp:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # the last line is cut short when the previous run was killed mid write
+                        continue
+                    if record['type'] == "search":
+                        self.searches[record['key']] = record['response']
+                    else:
+                        self.decisions[record['key']] = record
+        self._outp = open(path, 'a' if resume else 'w', encoding="utf-8")
+
+    def _write(self, record):
+        self._outp.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._outp.flush()
+
+    def search_tracks(self, sp, keys, queries, concurrency=8):
+        """
+        Same as search_executor.search_tracks, but answers journaled keys from the journal and journals new responses
+        """
+        pending = [query for key, query in zip(keys, queries) if key not in self.searches]
+        responses = search_executor.search_tracks(sp, pending, concurrency)
+        for key, query in zip(keys, queries):
+            if key in self.searches:
+                yield self.searches[key]
+            else:
+                response = next(responses)
+                self._write({"type": "search", "key": key, "query": query, "response": response})
+                yield response
+
+    def decide(self, key, action, song=None):
+        record = {"type": "decision", "key": key, "action": action}
+        if song is not None:
+            record['song'] = _storable(song)
+        self.decisions[key] = record
+        self._write(record)
+
+    def decided(self, key):
+        return key in self.decisions
+
+    def apply_decisions(self, table, not_found_songs):
+        """
+        Replays journaled decisions onto a freshly searched track table
+        Returns the songs still not found and the removed songs
+        """
+        removed = []
+        for key, decision in self.decisions.items():
+            if not table.has_slot(key):
+                continue
+            if decision['action'] == "replace":
+                table.put(key, decision['song'])
+            elif decision['action'] == "remove" and key in table:
+                removed.append(table.remove(key))
+
+        return [not_found_song for not_found_song in not_found_songs if not_found_song['key'] not in table], removed
+
+    def close(self):
+        self._outp.close()
@@ -0,0 +1,186 @@
+import os
+import json
+import click
+import urllib.parse
+from time import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from src.catalog import catalog_index
+from src.convert import apmusic_to_spotify, yt_to_spotify, batch_review, checkpoint, exact_match, pipeline
+from src.youtube import create_youtube_client
+from src.spotify import create_spotify_client, search_cache, rate_limiter
+
+# per process state of a worker, set up once by _init_worker and reused for every playlist it converts
+_worker = {}
+
+
+def is_apple_music(source):
+    return source.lower().endswith((".html", ".htm"))
+
+
+def parse_youtube_playlist_id(source):
+    """
+    Playlist id from a playlist id or a youtube url with a list parameter
+    """
+    query = urllib.parse.parse_qs(urllib.parse.urlparse(source).query)
+    return query['list'][0] if 'list' in query else source
+
+
+def convert_source(sp, matcher, source, settings):
+    """
+    Converts one manifest entry without prompts, the same way --batch does in the single playlist commands
+    Writes <name>-checkpoint.jsonl, <name>-review.jsonl and <name>-result.json to the output directory and returns
+    the result
+    """
+    if is_apple_music(source):
+        ap_playlist = apmusic_to_spotify.ApplePlaylistReader(source)
+        items = apmusic_to_spotify.apple_music_items(list(ap_playlist))
+        name = os.path.splitext(os.path.basename(source))[0]
+        title, description = ap_playlist.title, f"funee monkey smile: {ap_playlist.title}"
+    else:
+        playlist_id = parse_youtube_playlist_id(source)
+        items = yt_to_spotify.youtube_items(settings['secret_file'], playlist_id)
+        yt_playlist = yt_to_spotify.get_youtube_playlist(settings['secret_file'], playlist_id)
+        name = playlist_id
+        title, description = yt_playlist['snippet']['title'], yt_playlist['snippet']['description']
+
+    output = os.path.join(settings['output_dir'], name)
+    journal = checkpoint.Checkpoint(f"{output}-checkpoint.jsonl", resume=settings['resume'])
+    matcher.stats.clear()
+    try:
+        songs, not_found_songs = pipeline.search_songs(sp, matcher, journal, items, settings['concurrency'],
+                                                       hidden=True)
+        not_found_songs, removed_songs = journal.apply_decisions(songs, not_found_songs)
+        reviewed_songs = batch_review.auto_review(songs, not_found_songs, f"{output}-review.jsonl",
+                                                  settings['threshold'], journal)
+        sp_playlist = pipeline.create_spotify_playlist(sp, title, description, songs, hidden=True)
+    finally:
+        journal.close()
+
+    result = {
+        "source": source,
+        "title": title,
+        "spotify_playlist_id": sp_playlist['id'],
+        "items": len(items),
+        "added": len(songs),
+        "removed": len(removed_songs),
+        "sent_to_review": len(reviewed_songs) + len(not_found_songs),
+        "not_found": len(not_found_songs),
+        "matches": dict(matcher.stats),
+        "review_file": f"{output}-review.jsonl"
+    }
+    with open(f"{output}-result.json", 'w', encoding="utf-8") as outp:
+        json.dump(result, outp, indent=4, ensure_ascii=False)
+    return result
+
+
+def _init_worker(settings, spotify_bucket, youtube_bucket):
+    # every worker draws from the same two rate budgets, the search cache is shared through its sqlite file
+    rate_limiter.SPOTIFY.bucket = spotify_bucket
+    rate_limiter.YOUTUBE.bucket = youtube_bucket
+    create_youtube_client.CACHE_DIR = None if settings['no_cache'] else settings['cache_dir']
+    sp = create_spotify_client.create_spotify_client(settings['spotify_client_id'], settings['spotify_client_secret'])
+    catalog = catalog_index.CatalogIndex(settings['catalog_index_file']) if settings['catalog_index_file'] else None
+    _worker['settings'] = settings
+    _worker['sp'] = search_cache.cached_client(sp, settings['no_cache'], settings['cache_dir'])
+    _worker['matcher'] = exact_match.ExactMatcher(settings['exports_dir'], catalog)
+
+
+def _convert(source):
+    started = time()
+    try:
+        entry = convert_source(_worker['sp'], _worker['matcher'], source, _worker['settings'])
+    except Exception as e:
+        entry = {"source": source, "error": str(e)}
+    entry['seconds'] = round(time() - started, 3)
+    return entry
+
+
+@click.command()
+@click.option('--secret-file', default="client_secret.json", help="Path to GoogleAPI Credential File")
+@click.option('--spotify-client-id', envvar='SPOTIFY_CLIENT_ID', required=True,
+              help="Default is SPOTIFY_CLIENT_ID env variable")
+@click.option('--spotify-client-secret', envvar='SPOTIFY_CLIENT_SECRET', required=True,
+              help="Default is SPOTIFY_CLIENT_SECRET env variable")
+@click.option('--workers', default=4, show_default=True, help="Number of playlists converted at once, one process each")
+@click.option('--concurrency', default=4, show_default=True, help="Number of Spotify searches each worker runs at once")
+@click.option('--rate', default=rate_limiter.SPOTIFY_RATE, show_default=True, help="Maximum Spotify requests per second across all workers")
+@click.option('--youtube-rate', default=rate_limiter.YOUTUBE_RATE, show_default=True,
+              help="Maximum YouTube requests per second across all workers")
+@click.option('--no-cache', is_flag=True,
+              help="Always send searches to Spotify and YouTube requests in full instead of using the local caches")
+@click.option('--cache-dir', default=search_cache.DEFAULT_CACHE_DIR, show_default=True,
+              help="Directory of the local search and YouTube ETag caches, shared by all workers")
+@click.option('--threshold', default=batch_review.DEFAULT_THRESHOLD, show_default=True,
+              help="Minimum title/artist similarity (0-1) for a match to be accepted")
+@click.option('--exports-dir', default=None,
+              help="Directory of earlier export-spotify-playlist outputs to match against before searching")
+@click.option('--catalog-index', 'catalog_index_file', default=None, type=click.Path(exists=True, dir_okay=False),
+              help="Index from build-catalog-index to look tracks up in before searching on Spotify")
+@click.option('--output-dir', default=".", show_default=True,
+              help="Directory for the checkpoint, review and result files and the summary")
+@click.option('--resume', is_flag=True, help="Continue from the checkpoint journals an interrupted run left behind")
+@click.argument('manifest', type=click.File('r'))
+def convert_many(manifest, secret_file, spotify_client_id, spotify_client_secret, workers, concurrency, rate,
+                 youtube_rate, no_cache, cache_dir, threshold, exports_dir, catalog_index_file, output_dir, resume):
+    """
+    Converts every playlist of a manifest file into spotify ones in parallel, without prompts
+    The manifest has one youtube playlist id or url, or apple music html file, per line
+    Each playlist gets a result and review file, convert-many-summary.json sums them up
+    """
+    sources = [line.strip() for line in manifest if line.strip() and not line.startswith("#")]
+    if not sources:
+        raise click.UsageError("The manifest has no playlists")
+    os.makedirs(output_dir, exist_ok=True)
+
+    # authorize once up front so the workers start from the saved tokens instead of each asking for a login
+    create_spotify_client.create_spotify_client(spotify_client_id, spotify_client_secret).me()
+    if not all(map(is_apple_music, sources)):
+        create_youtube_client.load_youtube_credentials(secret_file)
+
+    settings = {
+        "secret_file": secret_file,
+        "spotify_client_id": spotify_client_id,
+        "spotify_client_secret": spotify_client_secret,
+        "concurrency": concurrency,
+        "no_cache": no_cache,
+        "cache_dir": cache_dir,
+        "threshold": threshold,
+        "exports_dir": exports_dir,
+        "catalog_index_file": catalog_index_file,
+        "output_dir": output_dir,
+        "resume": resume
+    }
+    started = time()
+    results = [None] * len(sources)
+    with ProcessPoolExecutor(max_workers=max(1, min(workers, len(sources))), initializer=_init_worker,
+                             initargs=(settings, rate_limiter.SharedTokenBucket(rate),
+                                       rate_limiter.SharedTokenBucket(youtube_rate))) as executor:
+        futures = {executor.submit(_convert, source): index for index, source in enumerate(sources)}
+        with click.progressbar(length=len(sources), label="Converting playlists",
+                               item_show_func=lambda entry: entry and entry['source']) as bar:
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+                bar.update(1, results[futures[future]])
+
+    converted = [result for result in results if 'error' not in result]
+    summary = {
+        "playlists": len(results),
+        "converted": len(converted),
+        "items": sum(result['items'] for result in converted),
+        "added": sum(result['added'] for result in converted),
+        "sent_to_review": sum(result['sent_to_review'] for result in converted),
+        "seconds": round(time() - started, 3),
+        "results": results
+    }
+    with open(os.path.join(output_dir, "convert-many-summary.json"), 'w', encoding="utf-8") as outp:
+        json.dump(summary, outp, indent=4, ensure_ascii=False)
+
+    click.echo("\n===============================")
+    for result in converted:
+        click.echo(f"{result['title']}: added {result['added']}/{result['items']}, "
+                   f"{result['sent_to_review']} to review in {result['review_file']}")
+    for result in results:
+        if 'error' in result:
+            click.echo(f"Failed: {result['source']} | {result['error']}")
+    click.echo(f"Converted {summary['converted']}/{summary['playlists']} playlists, added {summary['added']}/"
+               f"{summary['items']} tracks in {summary['seconds']}s")
@@ -0,0 +1,133 @@
+import os
+import re
+import json
+from glob import glob
+from collections import Counter
+from src.spotify import track_record
+
+_NON_WORD = re.compile(r"[\W_]+")
+_ISRC = re.compile(r"\bISRC\W*([A-Z]{2}-?[A-Z0-9]{3}-?\d{2}-?\d{5})\b", re.IGNORECASE)
+
+
+def match_key(title, artist):
+    return f"{' '.join(_NON_WORD.sub(' ', title.lower()).split())}|{' '.join(_NON_WORD.sub(' ', artist.lower()).split())}"
+
+
+def find_isrc(text):
+    found = _ISRC.search(text or "")
+    return found.group(1).replace("-", "").upper() if found else None
+
+
+def export_track(record):
+    """
+    Track dict in search result shape from a json export item or a compact ndjson/csv export record
+    """
+    if 'track' in record:
+        return record['track']
+    artists = record.get('artists') or []
+    if isinstance(artists, str):
+        artists = artists.split("; ")
+    return {
+        "id": record.get('id'),
+        "name": record.get('name'),
+        "artists": [{"name": artist} for artist in artists],
+        "album": {"name": record.get('album')},
+        "duration_ms": record.get('duration_ms'),
+        "external_ids": {"isrc": record.get('isrc')} if record.get('isrc') else {}
+    }
+
+
+def iter_export_tracks(path):
+    """
+    Trimmed tracks (see track_record.trim_track) of a json or ndjson export, the matcher and the catalog index
+    keep every one of them
+    """
+    with open(path, 'r', encoding="utf-8") as inp:
+        if path.endswith(".ndjson"):
+            records = (json.loads(line) for line in inp if line.strip())
+        else:
+            records = json.load(inp)
+        for record in records:
+            track = export_track(record)
+            if track and track.get('id') and track.get('artists'):
+                yield track_record.trim_track(track)
+
+
+class ExactMatcher:
+    """
+    Deterministic matching ahead of the free-text search
+    Items whose title and artist match a track of a previous export are answered locally, items with a known ISRC
+    are looked up with an isrc: search, then a catalog index (see build-catalog-index) is asked when one is given,
+    only the rest go to the normal text search
+    """
+
+    def __init__(self, exports_dir=None, catalog=None):
+        self.catalog = catalog
+        self.by_name = {}
+        self.by_isrc = {}
+        self.stats = Counter()
+        if exports_dir:
+            for path in glob(os.path.join(exports_dir, "*-spotify-tracks.json")) + \
+                    glob(os.path.join(exports_dir, "*-spotify-tracks.ndjson")):
+                for track in iter_export_tracks(path):
+                    self.add(track)
+
+    def add(self, track):
+        self.by_name.setdefault(match_key(track['name'], track['artists'][0]['name']), track)
+        isrc = (track.get('external_ids') or {}).get('isrc')
+        if isrc:
+            self.by_isrc.setdefault(isrc.upper(), track)
+
+    def local_match(self, identity):
+        if identity.get('isrc') and identity['isrc'] in self.by_isrc:
+            return self.by_isrc[identity['isrc']]
+        if identity.get('title') and identity.get('artist'):
+            return self.by_name.get(match_key(identity['title'], identity['artist']))
+        return None
+
+    def search_tracks(self, sp, journal, keys, queries, identities, concurrency=8):
+        """
+        Drop-in for journal.search_tracks taking an identity dict (title, artist, isrc, any may be None) per query
+        Yields a search shaped response per query in input order
+        """
+        responses = [None] * len(queries)
+        for index, identity in enumerate(identities):
+            track = self.local_match(identity)
+            if track:
+                responses[index] = {"tracks": {"items": [dict(track)]}}
+                self.stats['local'] += 1
+
+        isrc_indexes = [index for index, identity in enumerate(identities)
+                        if responses[index] is None and identity.get('isrc')]
+        isrc_responses = journal.search_tracks(sp, [f"isrc:{keys[index]}" for index in isrc_indexes],
+                                               [f"isrc:{identities[index]['isrc']}" for index in isrc_indexes],
+                                               concurrency)
+        for index, response in zip(isrc_indexes, isrc_responses):
+            if response['tracks']['items']:
+                responses[index] = response
+                self.stats['isrc'] += 1
+
+        if self.catalog:
+            for index, identity in enumerate(identities):
+                if responses[index] is not None:
+                    continue
+                text = f"{identity['title']} {identity['artist']}" if identity.get('title') and identity.get('artist') \
+                    else queries[index]
+                tracks = self.catalog.search(text)
+                if tracks:
+                    responses[index] = {"tracks": {"items": tracks}}
+                    self.stats['catalog'] += 1
+
+        text_indexes = [index for index, response in enumerate(responses) if response is None]
+        text_responses = journal.search_tracks(sp, [keys[index] for index in text_indexes],
+                                               [queries[index] for index in text_indexes], concurrency)
+        for index, response in enumerate(responses):
+            if response is None:
+                response = next(text_responses)
+                self.stats['search' if response['tracks']['items'] else 'not_found'] += 1
+            yield response
+
+    def report(self):
+        return (f"Matched {self.stats['local']} from exports, {self.stats['isrc']} by ISRC, "
+                f"{self.stats['catalog']} from the catalog index, {self.stats['search']} by search, "
+                f"{self.stats['not_found']} not found")
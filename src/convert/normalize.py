@@ -0,0 +1,100 @@
+import re
+
+
+def _case_variants(strings, capitalize=True):
+    variants = list(strings)
+    variants += [string.upper() for string in variants]
+    if capitalize:
+        variants += [string.capitalize() for string in variants]
+    return list(dict.fromkeys(variants))
+
+
+def _alternation(strings):
+    return "|".join(re.escape(string) for string in strings)
+
+
+# apple music: the first parenthesised/bracketed part holding one of these gets dropped, earlier flags win
+APPLE_MUSIC_FLAGS = tuple(_case_variants(
+    ['feat.', 'ft.', 'with', 'from', 'remaster', 'bonus', 'single', "radio", "interlude", "enterlude", "mixed"]))
+APPLE_MUSIC_SONG_TABLE = str.maketrans("", "", "'\":&?")
+APPLE_MUSIC_ARTIST_TABLE = str.maketrans("", "", "'\":!")
+
+# youtube: video title noise, removed in one pass and then any brackets left empty by it
+YOUTUBE_REMOVE_WORDS = re.compile(_alternation(_case_variants(
+    ['MV', 'Official Music Video', 'Official Video', 'Official Lyric Video', 'Official HD Video', 'Official Audio',
+     'LyricVideo', 'MusicVideo', 'Audio', 'Video', 'HD', 'Original Song', 'HQ', 'Color Coded', 'From', 'Lyrics'],
+    capitalize=False)))
+YOUTUBE_REMOVE_BRACKETS = re.compile(r"[(\[【（]\s*[)\]】）]|\|「 |『 |[」』【】]")
+# any bracketed part, dropped whole for title only searches
+BRACKETED = re.compile(r"[(\[【（][^)\]】）]*[)\]】）]")
+
+# spotify results whose name contains one of these are flagged for review
+FLAGGED_NAMES = re.compile(_alternation(_case_variants(['version', 'remix', 'instrumental', 'ver.'])))
+
+
+def normalize_apple_music_song(song_name):
+    first_parenthesis = song_name.find("(")
+    second_parenthesis = song_name.find(")")
+    first_bracket = song_name.find("[")
+    second_bracket = song_name.find("]")
+
+    parenthesis_content = song_name[first_parenthesis + 1:second_parenthesis] \
+        if -1 not in (first_parenthesis, second_parenthesis) else ""
+    bracket_content = song_name[first_bracket + 1:second_bracket] if -1 not in (first_bracket, second_bracket) else ""
+
+    for flag_string in APPLE_MUSIC_FLAGS:
+        if flag_string in parenthesis_content:
+            song_name = song_name[:first_parenthesis] + song_name[second_parenthesis + 1:]
+            break
+        if flag_string in bracket_content:
+            song_name = song_name[:first_bracket] + song_name[second_bracket + 1:]
+            break
+
+    song_name = song_name.translate(APPLE_MUSIC_SONG_TABLE)
+    if len(song_name) > 120: song_name = song_name[:69]
+    return song_name.strip()
+
+
+def normalize_apple_music_artist(artist_name):
+    artist_name = artist_name.translate(APPLE_MUSIC_ARTIST_TABLE)
+    return re.split("[&,]", artist_name, maxsplit=1)[0]
+
+
+def apple_music_query(ap_item):
+    return f"track:{normalize_apple_music_song(ap_item['song'])} artist:{normalize_apple_music_artist(ap_item['artist'])}"
+
+
+def apple_music_queries(ap_items):
+    return [apple_music_query(ap_item) for ap_item in ap_items]
+
+
+def normalize_youtube_title(title):
+    return YOUTUBE_REMOVE_BRACKETS.sub("", YOUTUBE_REMOVE_WORDS.sub("", title))
+
+
+def simplified_title(title):
+    """
+    Title without its bracketed parts and youtube noise words, for title only searches
+    """
+    return " ".join(normalize_youtube_title(BRACKETED.sub("", title)).split())
+
+
+def youtube_query(title, channel_title, auto_generated):
+    if auto_generated:
+        query = f'{title} - {channel_title.replace(" - Topic", "")}'
+    else:
+        query = normalize_youtube_title(title)
+
+    if len(query) > 120: query = query[:69]
+    return query
+
+
+def youtube_queries(videos):
+    """
+    Takes (title, channel title, auto generated) tuples and returns the spotify search query for each
+    """
+    return [youtube_query(title, channel_title, auto_generated) for title, channel_title, auto_generated in videos]
+
+
+def is_flagged(song_name):
+    return FLAGGED_NAMES.search(song_name) is not None
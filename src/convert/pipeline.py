@@ -0,0 +1,164 @@
+import queue
+import threading
+import click
+from src.convert import track_table, batch_review
+
+CHUNK_SIZE = 100
+
+
+def _matches(sp, matcher, journal, items, concurrency):
+    """
+    Yields each item (without its identity) with its top search result, the item itself as None when nothing was found
+    """
+    responses = matcher.search_tracks(sp, journal, [item['key'] for item in items], [item['query'] for item in items],
+                                      [item['identity'] for item in items], concurrency)
+    for item, response in zip(items, responses):
+        attached = {key: value for key, value in item.items() if key != 'identity'}
+        if not response['tracks']['items']:
+            yield attached, None
+            continue
+        # search results are shared between responses, the match gets its own copy
+        song = dict(response['tracks']['items'][0])
+        song['other_results'] = response['tracks']['items']
+        song.update(attached)
+        yield attached, song
+
+
+def _progress(bar, index, total, item, song):
+    if song is None:
+        bar.update(1, "     Track not found for " + item['query'])
+    else:
+        bar.update(1,
+                   f"{index + 1}/{total} {song['name']} - {song['artists'][0]['name']}               ====              {item['query']}")
+
+
+def search_songs(sp, matcher, journal, items, concurrency=8, hidden=False):
+    """
+    Searches every source item (dicts of key, query, identity, source and for youtube youtube_id) through matcher
+    Returns the track table of found songs and the items nothing was found for, both in source order
+    """
+    songs = track_table.TrackTable([item['key'] for item in items])
+    not_found_songs = []
+    with click.progressbar(length=len(items), label="Searching on Spotify", item_show_func=lambda q: q,
+                           hidden=hidden) as bar:
+        for index, (item, song) in enumerate(_matches(sp, matcher, journal, items, concurrency)):
+            if song is None:
+                not_found_songs.append(item)
+            else:
+                songs.put(item['key'], song)
+            _progress(bar, index, len(items), item, song)
+
+    return songs, not_found_songs
+
+
+def create_spotify_playlist(sp, name, description, songs, hidden=False):
+    """
+    Creates a private playlist of the current user holding songs in order, 100 tracks per request
+    """
+    user_id = sp.me()['id']
+    sp_playlist = sp.user_playlist_create(user_id, name, False, False, description)
+    song_ids = [song['id'] for song in songs]
+
+    with click.progressbar(length=len(song_ids), label="Adding to Spotify Playlist", hidden=hidden) as bar:
+        for pos in range(0, len(song_ids), CHUNK_SIZE):
+            chunk = song_ids[pos:pos + CHUNK_SIZE]
+            sp.user_playlist_add_tracks(user_id, sp_playlist['id'], chunk)
+            bar.update(len(chunk))
+
+    return sp_playlist
+
+
+class PlaylistWriter:
+    """
+    Writer stage of the streaming pipeline, a thread adding queued track ids to a playlist in 100 track chunks
+    as soon as a chunk fills up, each at the position right after the previous one
+    put() blocks while queue_size ids are waiting, which in turn holds back the searches (search_executor sends
+    only a few past the last response taken), close() writes the last chunk and waits for it
+    """
+
+    def __init__(self, sp, playlist_id, queue_size=CHUNK_SIZE * 5):
+        self.sp = sp
+        self.playlist_id = playlist_id
+        self.written = 0
+        self.error = None
+        self._queue = queue.Queue(queue_size)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _flush(self, chunk):
+        # after a failed write the rest is only drained so put() never blocks for good
+        if self.error is None:
+            try:
+                self.sp.playlist_add_items(self.playlist_id, chunk, position=self.written)
+                self.written += len(chunk)
+            except Exception as e:
+                self.error = e
+
+    def _run(self):
+        chunk = []
+        while True:
+            track_id = self._queue.get()
+            if track_id is None:
+                if chunk:
+                    self._flush(chunk)
+                return
+            chunk.append(track_id)
+            if len(chunk) == CHUNK_SIZE:
+                self._flush(chunk)
+                chunk = []
+
+    def put(self, track_id):
+        if self.error is not None:
+            raise self.error
+        self._queue.put(track_id)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        if self.error is not None:
+            raise self.error
+
+
+def stream_songs(sp, matcher, journal, items, writer, review_file, threshold=batch_review.DEFAULT_THRESHOLD,
+                 concurrency=8, hidden=False):
+    """
+    Batch mode search, review and playlist write in one pass
+    Each item is settled as its search response comes in (journaled decisions first, then batch_review.best_match)
+    and accepted songs go to writer right away, in source order
+    Returns the track table of accepted songs, the not found items, the removed songs and the songs sent to review,
+    as search_songs, journal.apply_decisions and batch_review.auto_review would have
+    """
+    songs = track_table.TrackTable([item['key'] for item in items])
+    not_found_songs = []
+    removed_songs = []
+    reviewed_songs = []
+    with open(review_file, 'w', encoding="utf-8") as outp, \
+            click.progressbar(length=len(items), label="Searching and adding to Spotify Playlist",
+                              item_show_func=lambda q: q, hidden=hidden) as bar:
+        try:
+            for index, (item, song) in enumerate(_matches(sp, matcher, journal, items, concurrency)):
+                _progress(bar, index, len(items), item, song)
+                decision = journal.decisions.get(item['key'], {})
+                if decision.get('action') == "replace":
+                    # picked by hand in an earlier run, taken as is
+                    accepted = decision['song']
+                elif song is None:
+                    not_found_songs.append(item)
+                    batch_review.write_review(outp, "not_found", item)
+                    continue
+                elif decision.get('action') == "remove":
+                    removed_songs.append(song)
+                    continue
+                else:
+                    accepted, scored = batch_review.best_match(song, threshold)
+                    if accepted is None:
+                        reviewed_songs.append(song)
+                        batch_review.write_review(outp, "low_confidence", song, scored)
+                        continue
+
+                songs.put(item['key'], accepted)
+                writer.put(accepted['id'])
+        finally:
+            writer.close()
+
+    return songs, not_found_songs, removed_songs, reviewed_songs
@@ -0,0 +1,84 @@
+import os
+import json
+from src.export import export_spotify_playlist
+
+
+def source_key(item):
+    """
+    Position independent identity of a source item, the youtube video id or the apple music song and artist
+    """
+    if item.get('youtube_id'):
+        return item['youtube_id']
+    return f"{item['source']['title']}|{item['source']['artist']}"
+
+
+class SyncState:
+    """
+    Source item to spotify track id mapping of a synced playlist as of its last sync, kept in a json file
+    Items nothing was found for (or that were removed in review) map to None, so they aren't searched again
+    Delete the file to search every item again
+    """
+
+    def __init__(self, path, playlist_id):
+        self.path = path
+        self.playlist_id = playlist_id
+        self.tracks = {}
+        self.exists = os.path.exists(path)
+        if self.exists:
+            with open(path, 'r', encoding="utf-8") as inp:
+                state = json.load(inp)
+            if state['playlist_id'] != playlist_id:
+                raise ValueError(f"{path} tracks playlist {state['playlist_id']}, not {playlist_id}")
+            self.tracks = state['tracks']
+
+    def new_items(self, items):
+        return [item for item in items if source_key(item) not in self.tracks]
+
+    def gone_keys(self, items):
+        current = {source_key(item) for item in items}
+        return [key for key in self.tracks if key not in current]
+
+    def save(self):
+        with open(self.path, 'w', encoding="utf-8") as outp:
+            json.dump({"playlist_id": self.playlist_id, "tracks": self.tracks}, outp, indent=4, ensure_ascii=False)
+
+
+def _batches(seq, size=100):
+    return (seq[pos:pos + size] for pos in range(0, len(seq), size))
+
+
+def sync_spotify_playlist(sp, state, items, songs):
+    """
+    Brings the synced playlist in line with items, songs being the accepted matches of state.new_items(items)
+    Tracks of new items are appended and tracks only gone items used are removed, 100 per request
+    On a first sync the tracks already in the playlist are left where they are instead of added again
+    Returns the added and removed track ids
+    """
+    matched = {source_key(song): song['id'] for song in songs}
+    new_keys = [source_key(item) for item in state.new_items(items)]
+    gone_keys = state.gone_keys(items)
+
+    gone_ids = {state.tracks.pop(key) for key in gone_keys} - {None}
+    # tracks of gone items are still in the playlist until the removal below
+    present_ids = (set(state.tracks.values()) | gone_ids) - {None}
+    if not state.exists:
+        for page in export_spotify_playlist.iter_playlist_pages(sp, state.playlist_id, "items(track(id)),next,offset"):
+            present_ids.update(item['track']['id'] for item in page['items'] if item.get('track'))
+
+    add_ids = []
+    for key in new_keys:
+        state.tracks[key] = matched.get(key)
+        if state.tracks[key] and state.tracks[key] not in present_ids:
+            add_ids.append(state.tracks[key])
+            present_ids.add(state.tracks[key])
+    # a track stays while any current item still maps to it
+    remove_ids = list(gone_ids - set(state.tracks.values()))
+
+    for batch in _batches(remove_ids):
+        sp.playlist_remove_all_occurrences_of_items(state.playlist_id, batch)
+    for batch in _batches(add_ids):
+        sp.playlist_add_items(state.playlist_id, batch)
+
+    state.save()
+    state.exists = True
+    return add_ids, remove_ids
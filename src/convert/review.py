@@ -0,0 +1,192 @@
+import threading
+import click
+from functools import partial
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from src.convert import normalize
+from src.spotify import track_record, search_cache
+
+DEFAULT_PREFETCH_AHEAD = 5
+
+
+def carry_over(chosen_song, song):
+    """
+    Copy of the song picked to replace a match with what the converters attached to it (query, youtube id, source)
+    Search results are shared between songs, so they are never changed in place
+    """
+    chosen_song = dict(chosen_song)
+    for key in ('query', 'youtube_id', 'source'):
+        if key in song:
+            chosen_song[key] = song[key]
+    return chosen_song
+
+
+def alternative_queries(item):
+    """
+    Fallback searches for a song under review: its simplified source title alone, its source artist alone and its
+    source title and artist as they came, before normalization, leaving out the query already searched
+    """
+    title = item['source']['title'] or ""
+    artist = item['source']['artist'] or ""
+    queries = (normalize.simplified_title(title), artist, f"{title} {artist}")
+    return [query for query in dict.fromkeys(" ".join(query.split()) for query in queries)
+            if query and search_cache.normalize_query(query) != search_cache.normalize_query(item['query'])]
+
+
+class Prefetcher:
+    """
+    Runs the alternative searches of the next `ahead` songs of a review loop in the background while the current
+    one is reviewed, and serves them and typed searches from an in-memory LRU of up to size queries
+    """
+
+    def __init__(self, sp, ahead=DEFAULT_PREFETCH_AHEAD, size=512, workers=2, limit=9):
+        self.sp = sp
+        self.ahead = ahead
+        self.size = size
+        self.limit = limit
+        self.hits = 0
+        self.misses = 0
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+
+    def _search(self, query):
+        return track_record.trim_response(self.sp.search(query, type="track", limit=self.limit))['tracks']['items']
+
+    def _future(self, query):
+        """
+        Search future of query and whether it was already there
+        """
+        key = search_cache.normalize_query(query)
+        with self._lock:
+            future = self._results.get(key)
+            if future is not None:
+                self._results.move_to_end(key)
+                return future, True
+            future = self._results[key] = self._executor.submit(self._search, query)
+            while len(self._results) > self.size:
+                self._results.popitem(last=False)
+        # outside the lock, the callback runs right away when the search is already over
+        future.add_done_callback(partial(self._forget_failed, key))
+        return future, False
+
+    def _forget_failed(self, key, future):
+        # a failed (or cancelled) search is dropped so asking for it again sends it again
+        if future.cancelled() or future.exception() is not None:
+            with self._lock:
+                if self._results.get(key) is future:
+                    del self._results[key]
+
+    def warm(self, items, index):
+        """
+        Queues the alternative searches of items[index:index + ahead], the ones already run or queued are kept
+        """
+        for item in items[index:index + self.ahead]:
+            if 'source' in item:
+                for query in alternative_queries(item):
+                    self._future(query)
+
+    def search(self, query):
+        future, known = self._future(query)
+        if known and future.done():
+            self.hits += 1
+        else:
+            self.misses += 1
+        return future.result()
+
+    def stats(self):
+        return f"Review prefetch: {self.hits} searches ready, {self.misses} waited on"
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def manual_search(sp, ignore_label, item=None, prefetcher=None):
+    """
+    Prompts for a search query and a pick among its results, None when the ignore option is picked
+    Given the song under review, its alternative queries are offered as s0, s1...
+    Searches go through prefetcher when there is one
+    """
+    suggestions = alternative_queries(item) if item and 'source' in item else []
+    for index, suggestion in enumerate(suggestions):
+        click.echo(f"[s{index}] {suggestion}")
+    query = click.prompt(
+        "Input your manuel search query here (Try either a simpler query or a different version)"
+        + (", or s0, s1... for a suggested one" if suggestions else ""), type=str)
+    if query.strip().lower() in [f"s{index}" for index in range(len(suggestions))]:
+        query = suggestions[int(query.strip()[1:])]
+
+    if prefetcher:
+        searched_songs = prefetcher.search(query)
+    else:
+        searched_songs = track_record.trim_response(sp.search(query, type="track", limit=9))['tracks']['items']
+
+    for index, searched_song in enumerate(searched_songs):
+        click.echo(
+            f"[{index}] {searched_song['name']} - {searched_song['artists'][0]['name']} - {searched_song['album']['name']}")
+
+    click.echo(f"[{len(searched_songs)}] {ignore_label}")
+    option = click.prompt("Input option number", type=int, default=0)
+    return None if option == len(searched_songs) else searched_songs[option]
+
+
+def final_review(sp, table, not_added_songs, journal, prefetcher=None, warm=False):
+    """
+    Song by song walk through the track table, any song can be swapped for a manual search result or removed
+    Manual searches go through prefetcher, which warms the upcoming songs only with warm (most are never opened,
+    warming every step costs about 3 extra searches per song)
+    """
+    slot = table.first()
+    # 1 based position of slot among the filled slots, kept up to date on every move instead of counted
+    position = 1
+    selection_amount = 5
+
+    while slot is not None:
+        if prefetcher and warm:
+            upcoming, upcoming_slot = [], slot
+            while upcoming_slot is not None and len(upcoming) < prefetcher.ahead:
+                upcoming.append(table.song_at(upcoming_slot))
+                upcoming_slot = table.step(upcoming_slot, 1)
+            prefetcher.warm(upcoming, 0)
+        click.clear()
+        window = table.window(slot, selection_amount)
+        first_position = position - [song_slot for song_slot, _ in window].index(slot)
+        for window_position, (song_slot, song) in enumerate(window, first_position):
+            line = f"{window_position}/{len(table)} {song['name']} - {song['artists'][0]['name']}               ====              {song['query']}"
+            click.echo(f"\n ======= {line}\n" if song_slot == slot else line)
+
+        click.echo("\nControls: h for up, j or ENTER for down, m for more options")
+        song = table.song_at(slot)
+        user_input = click.prompt(
+            f"\n{position}/{len(table)} {song['name']} | {song['artists'][0]['name']} | {song['album']['name']} - review?",
+            default='j', type=click.Choice(['h', 'j', 'm'], case_sensitive=False), show_choices=True)
+        if user_input == "m":
+            chosen_song = manual_search(sp, "Completely Ignore and log", song, prefetcher)
+            if chosen_song is None:
+                table.remove(song['key'])
+                not_added_songs.append(song)
+                journal.decide(song['key'], "remove")
+                next_slot = table.step(slot, 1)
+                if next_slot is not None:
+                    # the next song moves up into the removed song's position
+                    slot = next_slot
+                else:
+                    slot = table.step(slot, -1)
+                    position -= 1
+            else:
+                chosen_song = carry_over(chosen_song, song)
+                table.put(song['key'], chosen_song)
+                journal.decide(song['key'], "replace", chosen_song)
+            click.echo("\n")
+        elif user_input == "h":
+            previous_slot = table.step(slot, -1)
+            if previous_slot is not None:
+                slot = previous_slot
+                position -= 1
+        elif user_input == "j":
+            next_slot = table.step(slot, 1)
+            if next_slot is not None:
+                slot = next_slot
+                position += 1
+            elif click.confirm("Are these your final results?", default=False):
+                break
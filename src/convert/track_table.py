@@ -0,0 +1,80 @@
+class TrackTable:
+    """
+    Conversion results in source order, one slot per source item keyed by the item's checkpoint key
+    Empty slots are items without a match (not found or removed), so putting and removing a song is O(1)
+    and a song found later on still lands at its source position
+    """
+
+    def __init__(self, keys):
+        self._slots = [None] * len(keys)
+        self._slot_by_key = {key: slot for slot, key in enumerate(keys)}
+        self._live = 0
+
+    def put(self, key, song):
+        slot = self._slot_by_key[key]
+        if self._slots[slot] is None:
+            self._live += 1
+        song['key'] = key
+        self._slots[slot] = song
+
+    def remove(self, key):
+        slot = self._slot_by_key[key]
+        song = self._slots[slot]
+        if song is not None:
+            self._live -= 1
+            self._slots[slot] = None
+        return song
+
+    def has_slot(self, key):
+        return key in self._slot_by_key
+
+    def __contains__(self, key):
+        return key in self._slot_by_key and self._slots[self._slot_by_key[key]] is not None
+
+    def __len__(self):
+        return self._live
+
+    def __iter__(self):
+        return (song for song in self._slots if song is not None)
+
+    @property
+    def size(self):
+        return len(self._slots)
+
+    def song_at(self, slot):
+        return self._slots[slot]
+
+    def step(self, slot, direction):
+        """
+        Closest filled slot before (direction -1) or after (direction 1) slot, None past either end
+        """
+        slot += direction
+        while 0 <= slot < len(self._slots):
+            if self._slots[slot] is not None:
+                return slot
+            slot += direction
+        return None
+
+    def first(self):
+        return self.step(-1, 1)
+
+    def window(self, slot, amount):
+        """
+        Up to amount filled slots on each side of slot, with slot itself, as (slot, song) pairs in order
+        """
+        before = []
+        current = slot
+        while len(before) < amount:
+            current = self.step(current, -1)
+            if current is None:
+                break
+            before.append(current)
+        after = []
+        current = slot
+        while len(after) < amount:
+            current = self.step(current, 1)
+            if current is None:
+                break
+            after.append(current)
+        return [(filled, self._slots[filled]) for filled in reversed(before)] + \
+            [(slot, self._slots[slot])] + [(filled, self._slots[filled]) for filled in after]
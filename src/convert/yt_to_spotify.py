@@ -1,41 +1,105 @@
-import os
 import pprint
 import click
 import pickle
 import urllib.parse
+from src.catalog import catalog_index
+from src.convert import normalize, batch_review, checkpoint, review, exact_match, pipeline, playlist_sync
 from src.youtube import create_youtube_client
-from src.spotify import create_spotify_client
+from src.export import export_spotify_playlist
+from src.profiling import profiler
+from src.spotify import create_spotify_client, search_cache, rate_limiter
 
 
-def get_youtube_playlist_items(secrets_file, playlist_id):
+def get_youtube_playlist_page(secrets_file, playlist_id, page_token=None):
     youtube = create_youtube_client.create_youtube_client(secrets_file)
-    response = youtube.playlistItems().list(
+    return youtube.playlistItems().list(
         part="snippet,contentDetails",
         maxResults=50,
-        playlistId=playlist_id
+        playlistId=playlist_id,
+        pageToken=page_token
     ).execute()
-    playlistItems = response['items']
 
-    while response.get('nextPageToken'):
-        response = youtube.playlistItems().list(
-            part="snippet",
-            maxResults=50,
-            playlistId=playlist_id,
-            pageToken=response['nextPageToken']
-        ).execute()
-        playlistItems = response['items'] + playlistItems
 
-    return playlistItems
+def get_youtube_playlist_pages(secrets_file, playlist_id):
+    pages = [get_youtube_playlist_page(secrets_file, playlist_id)]
+    while pages[-1].get('nextPageToken'):
+        pages.append(get_youtube_playlist_page(secrets_file, playlist_id, pages[-1]['nextPageToken']))
+    return pages
 
 
-def get_youtube_video(secrets_file, video_id):
+def get_localized_titles(secrets_file, video_ids):
     youtube = create_youtube_client.create_youtube_client(secrets_file)
-    response = youtube.videos().list(
-        part="snippet",
-        id=video_id,
-        hl="en"
-    ).execute()
-    return response['items'][0]
+    localized_titles = {}
+    for pos in range(0, len(video_ids), 50):
+        response = youtube.videos().list(
+            part="snippet",
+            id=",".join(video_ids[pos:pos + 50]),
+            hl="en",
+            maxResults=50
+        ).execute()
+        for video in response['items']:
+            if video['snippet']['localized']['title']:
+                localized_titles[video['id']] = video['snippet']['localized']['title']
+    return localized_titles
+
+
+def youtube_items(secrets_file, playlist_id):
+    """
+    Search pipeline items (see pipeline.search_songs) for the available videos of a youtube playlist, oldest first
+    With the ETag cache on, every page is requested with If-None-Match and the items are snapshotted under the
+    etags of all pages, a later call that gets the same etags back (any change, on any page, changes one) returns
+    the snapshot without looking up localized titles or normalizing again
+    """
+    profiler.mark("youtube playlist items")
+    pages = get_youtube_playlist_pages(secrets_file, playlist_id)
+    all_yt_items = [yt_item for page in pages for yt_item in page['items']]
+    cache = create_youtube_client.get_etag_cache()
+    etags = [page.get('etag') for page in pages]
+    if not all(etags):
+        cache = None
+    snapshot = cache.snapshot(playlist_id, " ".join(etags)) if cache else None
+    if snapshot is not None:
+        return snapshot
+
+    yt_items = [yt_item for yt_item in reversed(all_yt_items)
+                if yt_item['snippet']['description'] != "This video is unavailable."]
+
+    profiler.mark("youtube localized titles")
+    non_ascii_ids = [
+        yt_item['snippet']['resourceId']['videoId'] for yt_item in yt_items if not yt_item['snippet']['title'].isascii()
+    ]
+    localized_titles = get_localized_titles(secrets_file, non_ascii_ids)
+    yt_videos = [
+        (
+            localized_titles.get(yt_item['snippet']['resourceId']['videoId'], yt_item['snippet']['title']),
+            yt_item['snippet']['videoOwnerChannelTitle'],
+            yt_item['snippet']['description'].find("Auto-generated by YouTube.") != -1
+        )
+        for yt_item in yt_items
+    ]
+
+    items = []
+    for index, (yt_item, (title, channel_title, auto_generated), query) in \
+            enumerate(zip(yt_items, yt_videos, normalize.youtube_queries(yt_videos))):
+        video_id = yt_item['snippet']['resourceId']['videoId']
+        artist = channel_title.replace(" - Topic", "") if auto_generated else None
+        items.append({
+            "key": checkpoint.youtube_key(index, video_id),
+            "query": query,
+            "youtube_id": video_id,
+            "source": {"title": title, "artist": artist},
+            "identity": {
+                "title": title if auto_generated else None,
+                "artist": artist,
+                "isrc": exact_match.find_isrc(yt_item['snippet']['description'])
+            }
+        })
+
+    if cache:
+        # one unit per localized titles batch, what a snapshot hit saves
+        units = -(-len(non_ascii_ids) // 50)
+        cache.put_snapshot(playlist_id, " ".join(etags), units, items)
+    return items
 
 
 def get_youtube_playlist(secrets_file, playlist_id):
@@ -49,235 +113,191 @@ def get_youtube_playlist(secrets_file, playlist_id):
 
 @click.command()
 @click.option('--secret-file', default="client_secret.json", help="Path to GoogleAPI Credential File")
-@click.option('--spotify-client-id', default=os.environ['SPOTIFY_CLIENT_ID'],
+@click.option('--spotify-client-id', envvar='SPOTIFY_CLIENT_ID', required=True,
               help="Default is SPOTIFY_CLIENT_ID env variable")
-@click.option('--spotify-client-secret', default=os.environ['SPOTIFY_CLIENT_SECRET'],
+@click.option('--spotify-client-secret', envvar='SPOTIFY_CLIENT_SECRET', required=True,
               help="Default is SPOTIFY_CLIENT_SECRET env variable")
+@click.option('--concurrency', default=8, show_default=True, help="Number of Spotify searches to run at once")
+@click.option('--rate', default=rate_limiter.SPOTIFY_RATE, show_default=True,
+              help="Maximum Spotify requests per second")
+@click.option('--youtube-rate', default=rate_limiter.YOUTUBE_RATE, show_default=True,
+              help="Maximum YouTube requests per second")
+@click.option('--no-cache', is_flag=True,
+              help="Always send searches to Spotify and YouTube requests in full instead of using the local caches")
+@click.option('--cache-dir', default=search_cache.DEFAULT_CACHE_DIR, show_default=True,
+              help="Directory of the local search and YouTube ETag caches")
+@click.option('--batch', is_flag=True,
+              help="Skip every prompt, auto-accept matches above --threshold and log the rest to --review-file")
+@click.option('--threshold', default=batch_review.DEFAULT_THRESHOLD, show_default=True,
+              help="Minimum title/artist similarity (0-1) for a match to be accepted in batch mode")
+@click.option('--stream', is_flag=True,
+              help="With --batch, create the playlist first and add accepted songs while the search is still running")
+@click.option('--prefetch-ahead', default=review.DEFAULT_PREFETCH_AHEAD, show_default=True,
+              help="Number of upcoming songs whose fallback searches run in the background during the review")
+@click.option('--prefetch-final-review', is_flag=True,
+              help="Also run fallback searches in the background during the final review, about 3 per song")
+@click.option('--review-file', default=None, help="Batch mode review output, default is <playlist id>-review.jsonl")
+@click.option('--exports-dir', default=None,
+              help="Directory of earlier export-spotify-playlist outputs to match against before searching")
+@click.option('--catalog-index', 'catalog_index_file', default=None, type=click.Path(exists=True, dir_okay=False),
+              help="Index from build-catalog-index to look tracks up in before searching on Spotify")
+@click.option('--sync-to', default=None,
+              help="Spotify playlist (id, uri or url) to update in place instead of creating a new one, "
+                   "only items added since the last sync are searched")
+@click.option('--sync-state', 'sync_state_file', default=None,
+              help="Source to track mapping kept between syncs, default is <spotify playlist id>-sync.json")
+@click.option('--profile', is_flag=True, help="Print where the run spent its time and which api calls it made")
+@click.option('--profile-trace', default=None, help="Also write every api call and the profile summary to this json file")
+@click.option('--resume', default=None,
+              help="Checkpoint journal of an interrupted run to continue, new runs write <playlist id>-checkpoint.jsonl")
 @click.argument('playlist_id')
-def convert_yt_to_spotify(secret_file, playlist_id, spotify_client_id, spotify_client_secret):
+def convert_yt_to_spotify(secret_file, playlist_id, spotify_client_id, spotify_client_secret, concurrency,
+                          rate, youtube_rate, no_cache, cache_dir, batch, stream, threshold, review_file,
+                          prefetch_ahead, prefetch_final_review, exports_dir, catalog_index_file, sync_to,
+                          sync_state_file, profile, profile_trace, resume):
     """
     Takes a youtube playlist and converts it into a spotify one
     Make sure to retrieve spotify and youtube data api credentials
     """
+    if stream and (not batch or sync_to):
+        raise click.UsageError("--stream only works with --batch and without --sync-to")
+    profiler.start(profile, profile_trace)
+    rate_limiter.SPOTIFY.bucket = rate_limiter.TokenBucket(rate)
+    rate_limiter.YOUTUBE.bucket = rate_limiter.TokenBucket(youtube_rate)
+    create_youtube_client.CACHE_DIR = None if no_cache else cache_dir
+
     click.echo("")
     click.echo("Getting YouTube playlist items     ------------")
-    yt_items = list(reversed(get_youtube_playlist_items(secret_file, playlist_id)))
-    spotify_search_queries = []
-
-    # what's regex?
-    remove_strings = ['MV', 'Official Music Video', 'Official Video', 'Official Lyric Video',
-                      'Official HD Video', 'Official Audio', 'LyricVideo', 'MusicVideo', 'Audio',
-                      'Video', 'HD', 'Original Song', 'HQ', 'Color Coded',
-                      '()', '[]', '【 】', '（）', '( )', '[ ]', '【  】', '（ ）', 'From', 'Lyrics', '|'
-                                                                                              '「 ', '」', '『 ', '』', '【',
-                      '】']
-    remove_strings += [remove_string.upper() for remove_string in remove_strings]
-
-    for yt_item in yt_items:
-        description = yt_item['snippet']['description']
-        if description == "This video is unavailable.": continue
-
-        title = yt_item['snippet']['title']
-        if not title.isascii():
-            video = get_youtube_video(secret_file, yt_item['snippet']['resourceId']['videoId'])
-            if video['snippet']['localized']['title']:
-                title = video['snippet']['localized']['title']
-
-        artist = yt_item['snippet']['videoOwnerChannelTitle']
-
-        if description.find("Auto-generated by YouTube.") != -1:
-            spotify_search_queries.append(f'{title} - {artist.replace(" - Topic", "")}')
-        else:
-            for remove_string in remove_strings:
-                title = title.replace(remove_string, "")
-            spotify_search_queries.append(f'{title}')
+    items = youtube_items(secret_file, playlist_id)
+    profiler.mark("loading exports, catalog and journal")
+    catalog = catalog_index.CatalogIndex(catalog_index_file) if catalog_index_file else None
+    matcher = exact_match.ExactMatcher(exports_dir, catalog)
+    journal = checkpoint.Checkpoint(resume or f"{playlist_id}-checkpoint.jsonl", resume=bool(resume))
 
     sp = create_spotify_client.create_spotify_client(spotify_client_id, spotify_client_secret)
-    songs = []
-    flagged_songs = []
-    not_found_songs = []
-    flag_strings = ['version', 'remix', 'instrumental', 'ver.']
-    flag_strings += [flag_string.upper() for flag_string in flag_strings]
-    flag_strings += [flag_string.capitalize() for flag_string in flag_strings]
-    with click.progressbar(length=len(spotify_search_queries), label="Searching on Spotify",
-                           item_show_func=lambda q: q) as bar:
-        for index, query in enumerate(spotify_search_queries):
-            if len(query) > 120: query = query[:69]
-            response = sp.search(query, type="track", limit=9)
-            try:
-                song = response['tracks']['items'][0]
-                song['query'] = query
-                song['other_results'] = response['tracks']['items']
-                song['youtube_id'] = yt_items[index]['snippet']['resourceId']['videoId']
-                songs.append(song)
-                for flag_string in flag_strings:
-                    if flag_string in song['name']:
-                        flagged_songs.append(song)
-                        break
-                bar.update(1,
-                           f"{index + 1}/{len(spotify_search_queries)} {song['name']} - {song['artists'][0]['name']}               ====              {query}")
-            except IndexError:
-                not_found_songs.append(
-                    {
-                        "query": query,
-                        "youtube_id": yt_items[index]['snippet']['resourceId']['videoId']
-                    }
-                )
-                bar.update(1, "     Track not found for " + query)
+    sp = search_cache.cached_client(sp, no_cache, cache_dir)
+    sync_state = None
+    if sync_to:
+        sync_to = export_spotify_playlist.parse_playlist_id(sync_to)
+        sync_state = playlist_sync.SyncState(sync_state_file or f"{sync_to}-sync.json", sync_to)
+        click.echo(f"{len(sync_state.new_items(items))} new and {len(sync_state.gone_keys(items))} removed items "
+                   f"since the last sync")
+    search_items = sync_state.new_items(items) if sync_state else items
+    if stream:
+        profiler.mark("spotify search and playlist write")
+        review_file = review_file or f"{playlist_id}-review.jsonl"
+        click.echo("Creating Spotify Playlist...")
+        yt_playlist = get_youtube_playlist(secret_file, playlist_id)
+        sp_playlist = pipeline.create_spotify_playlist(sp, yt_playlist['snippet']['title'],
+                                                       yt_playlist['snippet']['description'], [])
+        writer = pipeline.PlaylistWriter(sp, sp_playlist['id'])
+        songs, not_found_songs, not_added_songs, reviewed_songs = pipeline.stream_songs(
+            sp, matcher, journal, search_items, writer, review_file, threshold, concurrency)
+        click.echo("===================================================================")
+        click.echo(f"Accepted {len(songs)}/{len(search_items)} songs, "
+                   f"{len(reviewed_songs) + len(not_found_songs)} written to {review_file}")
+    else:
+        profiler.mark("spotify search")
+        songs, not_found_songs = pipeline.search_songs(sp, matcher, journal, search_items, concurrency)
+        flagged_songs = [song for song in songs if normalize.is_flagged(song['name'])]
+
+        click.echo("===================================================================")
+        click.echo(f"Found {len(songs)}/{len(search_items)}")
+        click.echo(f"Flagged {len(flagged_songs)} songs\n")
+        not_found_songs, not_added_songs = journal.apply_decisions(songs, not_found_songs)
+
+    profiler.mark("review")
+    if batch and not stream:
+        review_file = review_file or f"{playlist_id}-review.jsonl"
+        reviewed_songs = batch_review.auto_review(songs, not_found_songs, review_file, threshold, journal)
+        click.echo(f"Accepted {len(songs)} songs, {len(reviewed_songs) + len(not_found_songs)} written to {review_file}")
+    elif not batch:
+        prefetcher = review.Prefetcher(sp, prefetch_ahead)
+        queued_songs = []
+        pending_songs = [song for song in flagged_songs if not journal.decided(song['key'])]
+        for index, flagged_song in enumerate(pending_songs):
+            # a flagged song may end up queued for a manual search below
+            prefetcher.warm(pending_songs, index)
+            yt_url = f"https://youtu.be/{flagged_song['youtube_id']}"
+            click.echo(
+                f"Flagged '{flagged_song['name']} - {flagged_song['artists'][0]['name']}'     -----    {flagged_song['query']}  ----   {yt_url}")
+            if click.confirm("Would you like to review more options for this song?", default=True):
+                searched_songs = flagged_song['other_results']
+                for index, searched_song in enumerate(searched_songs):
+                    if index == 0:
+                        click.echo(f"[0] Skip/Keep song")
+                    else:
+                        click.echo(
+                            f"[{index}] {searched_song['name']} - {searched_song['artists'][0]['name']} - {searched_song['album']['name']}")
 
-    click.echo("===================================================================")
-    click.echo(f"Found {len(songs)}/{len(spotify_search_queries)}")
-    click.echo(f"Flagged {len(flagged_songs)} songs\n")
-    not_added_songs = []
+                click.echo(f"[{len(searched_songs)}] Queue song for deletion if no results match")
+                option = click.prompt("Input option number", type=int, default=0)
 
-    for flagged_song in flagged_songs:
-        yt_url = f"https://youtu.be/{flagged_song['youtube_id']}"
-        click.echo(
-            f"Flagged '{flagged_song['name']} - {flagged_song['artists'][0]['name']}'     -----    {flagged_song['query']}  ----   {yt_url}")
-        if click.confirm("Would you like to review more options for this song?", default=True):
-            searched_songs = flagged_song['other_results']
-            for index, searched_song in enumerate(searched_songs):
-                if index == 0:
-                    click.echo(f"[0] Skip/Keep song")
+                if option == len(searched_songs):
+                    queued_songs.append(flagged_song)
                 else:
-                    click.echo(
-                        f"[{index}] {searched_song['name']} - {searched_song['artists'][0]['name']} - {searched_song['album']['name']}")
-
-            click.echo(f"[{len(searched_songs)}] Queue song for deletion if no results match")
-            option = click.prompt("Input option number", type=int, default=0)
-
-            if option == len(searched_songs):
-                not_added_songs.append(flagged_song)
+                    chosen_song = review.carry_over(searched_songs[option], flagged_song)
+                    songs.put(flagged_song['key'], chosen_song)
+                    journal.decide(flagged_song['key'], "replace", chosen_song)
+                click.echo("\n")
             else:
-                i = songs.index(flagged_song)
-                chosen_song = searched_songs[option]
-                chosen_song['query'] = flagged_song['query']
-                chosen_song['youtube_id'] = flagged_song['youtube_id']
-                songs = songs[:i] + [chosen_song] + songs[i + 1:]
-            click.echo("\n")
-
-    click.echo("\n")
-    for not_added_song in not_added_songs:
-        click.echo(
-            f"Removed: {not_added_song['name']} - {not_added_song['artists'][0]['name']} - https://youtu.be/{not_added_song['youtube_id']}")
-        if click.confirm("Would you like to search for more results for this song?", default=True):
-            query = click.prompt(
-                "Input your manuel search query here (Try either a simpler query or a different version)", type=str)
-            searched_songs = sp.search(query, type="track", limit=9)['tracks']['items']
-
-            for index, searched_song in enumerate(searched_songs):
-                click.echo(
-                    f"[{index}] {searched_song['name']} - {searched_song['artists'][0]['name']} - {searched_song['album']['name']}")
-
-            click.echo(f"[{len(searched_songs)}] Delete song and log")
-            option = click.prompt("Input option number", type=int, default=0)
+                journal.decide(flagged_song['key'], "keep")
+
+        click.echo("\n")
+        for index, queued_song in enumerate(queued_songs):
+            prefetcher.warm(queued_songs, index)
+            click.echo(
+                f"Removed: {queued_song['name']} - {queued_song['artists'][0]['name']} - https://youtu.be/{queued_song['youtube_id']}")
+            chosen_song = None
+            if click.confirm("Would you like to search for more results for this song?", default=True):
+                chosen_song = review.manual_search(sp, "Delete song and log", queued_song, prefetcher)
+                click.echo("\n")
 
-            if option == len(searched_songs):
-                songs.remove(not_added_song)
+            if chosen_song is None:
+                songs.remove(queued_song['key'])
+                not_added_songs.append(queued_song)
+                journal.decide(queued_song['key'], "remove")
             else:
-                i = songs.index(not_added_song)
-                chosen_song = searched_songs[option]
-                chosen_song['query'] = not_added_song['query']
-                chosen_song['youtube_id'] = not_added_song['youtube_id']
-                songs = songs[:i] + [chosen_song] + songs[i + 1:]
-                not_added_songs.remove(not_added_song)
-            click.echo("\n")
-        else:
-            songs.remove(not_added_song)
-    click.echo("\n")
-    for not_found_song in not_found_songs:
-        click.echo(
-            f"Did not find: {not_found_song['query']} - https://youtu.be/{urllib.parse.quote(not_found_song['youtube_id'])}")
-        if click.confirm("Would you like to search for this song?", default=True):
-            query = click.prompt(
-                "Input your manuel search query here (Try either a simpler query or a different version)", type=str)
-            searched_songs = sp.search(query, type="track", limit=9)['tracks']['items']
-
-            for index, searched_song in enumerate(searched_songs):
-                click.echo(
-                    f"[{index}] {searched_song['name']} - {searched_song['artists'][0]['name']} - {searched_song['album']['name']}")
-
-            click.echo(f"[{len(searched_songs)}] Completely Ignore and log")
-            option = click.prompt("Input option number", type=int, default=0)
-
-            if not option == len(searched_songs):
-                chosen_song = searched_songs[option]
-                chosen_song['query'] = not_found_song['query']
-                chosen_song['youtube_id'] = not_found_song['youtube_id']
-                songs.append(chosen_song)
-                not_found_songs.remove(not_found_song)
-            click.echo("\n")
-
-    click.echo("\n")
-    if not click.confirm("Final Review Process (go through each song) skip?", default=False):
-        current_song_index = 0
-        selection_amount = 5
-
-        while True:
-            click.clear()
-            current_selection = songs[current_song_index - selection_amount:current_song_index + selection_amount + 1]
-            for index, song in enumerate(current_selection):
-                song_index = current_song_index - selection_amount + index
-                if index < selection_amount or index > selection_amount:
-                    click.echo(
-                        f"{song_index + 1}/{len(songs)} {song['name']} - {song['artists'][0]['name']}               ====              {song['query']}")
-                else:
-                    click.echo(
-                        f"\n ======= {song_index + 1}/{len(songs)} {song['name']} - {song['artists'][0]['name']}               ====              {song['query']}\n")
-
-            click.echo("\nControls: h for up, j or ENTER for down, m for more options")
-            song = songs[current_song_index]
-            user_input = click.prompt(
-                f"\n{current_song_index + 1}/{len(songs)} {song['name']} | {song['artists'][0]['name']} | {song['album']['name']} - review?",
-                default='j', type=click.Choice(['h', 'j', 'm'], case_sensitive=False), show_choices=True)
-            if user_input == "m":
-                query = click.prompt(
-                    "Input your manuel search query here (Try either a simpler query or a different version)", type=str)
-                searched_songs = sp.search(query, type="track", limit=9)['tracks']['items']
-
-                for i, searched_song in enumerate(searched_songs):
-                    click.echo(
-                        f"[{i}] {searched_song['name']} - {searched_song['artists'][0]['name']} - {searched_song['album']['name']}")
-
-                click.echo(f"[{len(searched_songs)}] Completely Ignore and log")
-                option = click.prompt("Input option number", type=int, default=0)
-
-                if option == len(searched_songs):
-                    songs.remove(song)
-                    not_added_songs.append(song)
-                else:
-                    i = songs.index(song)
-                    chosen_song = searched_songs[option]
-                    chosen_song['query'] = song['query']
-                    chosen_song['youtube_id'] = song['youtube_id']
-                    songs = songs[:i] + [chosen_song] + songs[i + 1:]
+                chosen_song = review.carry_over(chosen_song, queued_song)
+                songs.put(queued_song['key'], chosen_song)
+                journal.decide(queued_song['key'], "replace", chosen_song)
+
+        click.echo("\n")
+        pending_songs = [song for song in not_found_songs if not journal.decided(song['key'])]
+        for index, not_found_song in enumerate(pending_songs):
+            prefetcher.warm(pending_songs, index)
+            click.echo(
+                f"Did not find: {not_found_song['query']} - https://youtu.be/{urllib.parse.quote(not_found_song['youtube_id'])}")
+            chosen_song = None
+            if click.confirm("Would you like to search for this song?", default=True):
+                chosen_song = review.manual_search(sp, "Completely Ignore and log", not_found_song, prefetcher)
                 click.echo("\n")
-            elif user_input == "h":
-                current_song_index -= 1
-            elif user_input == "j":
-                if current_song_index == len(songs) - 1:
-                    if click.confirm("Are these your final results?", default=False):
-                        break
-                    else:
-                        continue
-                else:
-                    current_song_index += 1
 
-    click.echo("\n===============================")
-    click.echo("Creating Spotify Playlist...")
-    yt_playlist = get_youtube_playlist(secret_file, playlist_id)
-    user_id = sp.me()['id']
-    sp_playlist = sp.user_playlist_create(user_id, yt_playlist['snippet']['title'], False, False,
-                                          yt_playlist['snippet']['description'])
-    song_ids = [song['id'] for song in songs]
+            if chosen_song is None:
+                journal.decide(not_found_song['key'], "ignore")
+            else:
+                chosen_song = review.carry_over(chosen_song, not_found_song)
+                songs.put(not_found_song['key'], chosen_song)
+                journal.decide(not_found_song['key'], "replace", chosen_song)
+        not_found_songs = [not_found_song for not_found_song in not_found_songs if not_found_song['key'] not in songs]
 
-    def chunker(seq, size):
-        return (seq[pos:pos + size] for pos in range(0, len(seq), size))
+        click.echo("\n")
+        if not click.confirm("Final Review Process (go through each song) skip?", default=False):
+            review.final_review(sp, songs, not_added_songs, journal, prefetcher, prefetch_final_review)
+        prefetcher.close()
+        click.echo(prefetcher.stats())
 
-    with click.progressbar(length=len(songs), label="Adding to Spotify Playlist") as bar:
-        for chunk in chunker(song_ids, 100):
-            sp.user_playlist_add_tracks(user_id, sp_playlist['id'], chunk)
-            bar.update(len(chunk))
+    click.echo("\n===============================")
+    profiler.mark("playlist write")
+    if sync_state:
+        click.echo("Syncing Spotify Playlist...")
+        added_ids, removed_ids = playlist_sync.sync_spotify_playlist(sp, sync_state, items, songs)
+        click.echo(f"Added {len(added_ids)} and removed {len(removed_ids)} tracks")
+    elif not stream:
+        click.echo("Creating Spotify Playlist...")
+        yt_playlist = get_youtube_playlist(secret_file, playlist_id)
+        pipeline.create_spotify_playlist(sp, yt_playlist['snippet']['title'], yt_playlist['snippet']['description'],
+                                         songs)
 
     click.echo("\n===============================")
     for not_added_song in not_added_songs:
@@ -288,3 +308,16 @@ def convert_yt_to_spotify(secret_file, playlist_id, spotify_client_id, spotify_c
     for not_found_song in not_found_songs:
         click.echo(
             f"Did not find: {not_found_song['query']} | https://youtu.be/{urllib.parse.quote(not_found_song['youtube_id'])}")
+
+    click.echo(matcher.report())
+    if catalog:
+        catalog.close()
+    journal.close()
+    if not no_cache:
+        click.echo(sp.cache.stats())
+        sp.cache.close()
+    click.echo(f"Spotify: {rate_limiter.SPOTIFY.stats()}")
+    click.echo(f"YouTube: {rate_limiter.YOUTUBE.stats()}")
+    if create_youtube_client.get_etag_cache():
+        click.echo(create_youtube_client.get_etag_cache().stats())
+    profiler.stop(profile_trace)
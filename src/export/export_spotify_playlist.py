@@ -1,28 +1,190 @@
 import click
 import os
-from json import dump
-from src.spotify import create_spotify_client
+import csv
+import json
+from time import time
+from concurrent.futures import ThreadPoolExecutor
+from src.profiling import profiler
+from src.spotify import create_spotify_client, rate_limiter
+
+PAGE_SIZE = 100
+COMPACT_FIELDS = ["id", "name", "artists", "album", "duration_ms", "isrc"]
+COMPACT_ITEM_FIELDS = "items(track(id,name,duration_ms,artists(name),album(name),external_ids(isrc))),next,offset"
+
+
+def iter_playlist_pages(sp, playlist_id, fields=None):
+    """
+    Yields playlist_items pages, the next page is requested in the background while the current one is handled
+    """
+    def fetch(offset):
+        return sp.playlist_items(playlist_id, fields=fields, limit=PAGE_SIZE, offset=offset)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        page = fetch(0)
+        while True:
+            upcoming = executor.submit(fetch, page['offset'] + PAGE_SIZE) if page['next'] else None
+            yield page
+            if upcoming is None:
+                break
+            page = upcoming.result()
+
+
+def compact_track(item):
+    track = item.get('track')
+    if not track:
+        return None
+    return {
+        "id": track.get('id'),
+        "name": track.get('name'),
+        "artists": [artist['name'] for artist in track.get('artists', [])],
+        "album": (track.get('album') or {}).get('name'),
+        "duration_ms": track.get('duration_ms'),
+        "isrc": (track.get('external_ids') or {}).get('isrc')
+    }
+
+
+def write_json(pages, output_file):
+    output_file.write("[")
+    first = True
+    for page in pages:
+        for item in page['items']:
+            output_file.write(("\n" if first else ",\n") + json.dumps(item, indent=4))
+            first = False
+        yield len(page['items'])
+    output_file.write("\n]")
+
+
+def write_ndjson(pages, output_file):
+    for page in pages:
+        tracks = [track for track in map(compact_track, page['items']) if track]
+        output_file.writelines(json.dumps(track, ensure_ascii=False) + "\n" for track in tracks)
+        yield len(page['items'])
+
+
+def write_csv(pages, output_file):
+    writer = csv.DictWriter(output_file, fieldnames=COMPACT_FIELDS)
+    writer.writeheader()
+    for page in pages:
+        for track in map(compact_track, page['items']):
+            if track:
+                writer.writerow({**track, "artists": "; ".join(track['artists'])})
+        yield len(page['items'])
+
+
+WRITERS = {
+    "json": (write_json, None),
+    "ndjson": (write_ndjson, COMPACT_ITEM_FIELDS),
+    "csv": (write_csv, COMPACT_ITEM_FIELDS),
+}
+
+
+def parse_playlist_id(playlist):
+    """
+    Accepts a bare id, a spotify:playlist: uri or an open.spotify.com url
+    """
+    return playlist.strip().split("?")[0].rstrip("/").split("/")[-1].split(":")[-1]
+
+
+def iter_current_user_playlist_ids(sp):
+    page = sp.current_user_playlists(limit=50)
+    while page:
+        for playlist in page['items']:
+            yield playlist['id']
+        page = sp.next(page) if page['next'] else None
+
+
+def export_playlist(sp, playlist_id, output_format="json", output_dir="."):
+    """
+    Streams a playlist to <playlist id>-spotify-tracks.<format> page by page and returns the output path
+    and the number of items written
+    json keeps the full playlist items, ndjson and csv keep only COMPACT_FIELDS
+    """
+    writer, fields = WRITERS[output_format]
+    playlist_id = parse_playlist_id(playlist_id)
+    path = os.path.join(output_dir, f'{playlist_id}-spotify-tracks.{output_format}')
+    count = 0
+    with open(path, 'w', encoding="utf-8", newline="") as output_file:
+        for written in writer(iter_playlist_pages(sp, playlist_id, fields), output_file):
+            count += written
+    return path, count
+
+
+def export_playlists(sp, playlist_ids, output_format="json", output_dir=".", concurrency=4):
+    """
+    Exports many playlists at once over one client and returns a manifest entry per playlist
+    A failing playlist is recorded in its entry instead of stopping the others
+    """
+    def export(playlist_id):
+        started = time()
+        entry = {"playlist_id": playlist_id}
+        try:
+            entry['path'], entry['tracks'] = export_playlist(sp, playlist_id, output_format, output_dir)
+        except Exception as e:
+            entry['error'] = str(e)
+        entry['seconds'] = round(time() - started, 3)
+        return entry
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        yield from executor.map(export, playlist_ids)
 
 
 @click.command()
-@click.option('--spotify-client-id', default=os.environ['SPOTIFY_CLIENT_ID'],
+@click.option('--spotify-client-id', envvar='SPOTIFY_CLIENT_ID', required=True,
               help="Default is SPOTIFY_CLIENT_ID env variable")
-@click.option('--spotify-client-secret', default=os.environ['SPOTIFY_CLIENT_SECRET'],
+@click.option('--spotify-client-secret', envvar='SPOTIFY_CLIENT_SECRET', required=True,
               help="Default is SPOTIFY_CLIENT_SECRET env variable")
-@click.argument('playlist_id')
-def export_spotify_playlist(playlist_id, spotify_client_id, spotify_client_secret):
+@click.option('--format', 'output_format', default="json", show_default=True, type=click.Choice(list(WRITERS)),
+              help="json keeps full playlist items, ndjson and csv keep id, name, artists, album, duration and ISRC")
+@click.option('--ids-file', type=click.File('r'), default=None, help="File with one playlist id, uri or url per line")
+@click.option('--all', 'all_playlists', is_flag=True, help="Export every playlist of the current user")
+@click.option('--output-dir', default=".", show_default=True, help="Directory for the exports and the manifest")
+@click.option('--concurrency', default=4, show_default=True, help="Number of playlists to export at once")
+@click.option('--rate', default=rate_limiter.SPOTIFY_RATE, show_default=True,
+              help="Maximum Spotify requests per second across all exports")
+@click.option('--profile', is_flag=True, help="Print where the run spent its time and which api calls it made")
+@click.option('--profile-trace', default=None, help="Also write every api call and the profile summary to this json file")
+@click.argument('playlist_ids', nargs=-1)
+def export_spotify_playlist(playlist_ids, spotify_client_id, spotify_client_secret, output_format, ids_file,
+                            all_playlists, output_dir, concurrency, rate, profile, profile_trace):
     """
-    Exports spotify playlist items metadata to json
+    Exports spotify playlist items metadata to json, ndjson or csv
+    Takes any number of playlist ids, an --ids-file or --all, writes export-manifest.json when exporting more than one
     """
+    profiler.start(profile, profile_trace)
+    profiler.mark("listing playlists")
+    rate_limiter.SPOTIFY.bucket = rate_limiter.TokenBucket(rate)
     sp = create_spotify_client.create_spotify_client(spotify_client_id, spotify_client_secret)
-    user_id = sp.me()['id']
 
-    playlist = sp.playlist(playlist_id)
-    response = sp.user_playlist_tracks(user_id, playlist_id, limit=50)
-    tracks = response['items']
-    while response['next']:
-        response = sp.user_playlist_tracks(user_id, playlist_id, limit=50, offset=response['offset'] + 50)
-        tracks += response['items']
+    playlist_ids = list(playlist_ids)
+    if ids_file:
+        playlist_ids += [line.strip() for line in ids_file if line.strip() and not line.startswith("#")]
+    if all_playlists:
+        playlist_ids += list(iter_current_user_playlist_ids(sp))
+    if not playlist_ids:
+        raise click.UsageError("Give at least one playlist id, --ids-file or --all")
+
+    os.makedirs(output_dir, exist_ok=True)
+    profiler.mark("exporting playlists")
+    if len(playlist_ids) == 1:
+        export_playlist(sp, playlist_ids[0], output_format, output_dir)
+        click.echo(f"Spotify: {sp.limiter.stats()}")
+        profiler.stop(profile_trace)
+        return
+
+    manifest = []
+    with click.progressbar(length=len(playlist_ids), label="Exporting playlists",
+                           item_show_func=lambda entry: entry and entry['playlist_id']) as bar:
+        for entry in export_playlists(sp, playlist_ids, output_format, output_dir, concurrency):
+            manifest.append(entry)
+            bar.update(1, entry)
+
+    with open(os.path.join(output_dir, "export-manifest.json"), 'w') as output_file:
+        json.dump(manifest, output_file, indent=4)
 
-    with open(f'{playlist["id"]}-spotify-tracks.json', 'w') as output_file:
-        dump(tracks, output_file, indent=4)
+    failed = [entry for entry in manifest if 'error' in entry]
+    click.echo(f"Exported {len(manifest) - len(failed)}/{len(manifest)} playlists, "
+               f"{sum(entry.get('tracks', 0) for entry in manifest)} tracks")
+    for entry in failed:
+        click.echo(f"Failed: {entry['playlist_id']} | {entry['error']}")
+    click.echo(f"Spotify: {sp.limiter.stats()}")
+    profiler.stop(profile_trace)
@@ -1,14 +1,42 @@
 import click
-from src.convert import *
-from src.export import *
+from importlib import import_module
 
+# command name: (module, command function, short help), a module is only imported when its command runs
+COMMANDS = {
+    "convert-yt-to-spotify": ("src.convert.yt_to_spotify", "convert_yt_to_spotify",
+                              "Takes a youtube playlist and converts it into a spotify one"),
+    "export-spotify-playlist": ("src.export.export_spotify_playlist", "export_spotify_playlist",
+                                "Exports spotify playlist items metadata to json, ndjson or csv"),
+    "convert-ap-to-spotify": ("src.convert.apmusic_to_spotify", "convert_ap_to_spotify",
+                              "Takes an apple music playlist (from an html or htm file) and converts it into a spotify one"),
+    "convert-many": ("src.convert.convert_many", "convert_many",
+                     "Converts every playlist of a manifest file into spotify ones in parallel, without prompts"),
+    "build-catalog-index": ("src.catalog.catalog_index", "build_catalog_index",
+                            "Builds a local search index from export-spotify-playlist outputs"),
+}
 
-@click.group()
+
+class LazyGroup(click.Group):
+    """
+    Group that imports a subcommand's module when the subcommand is invoked, the command list and --help
+    come from COMMANDS so they import nothing
+    """
+
+    def list_commands(self, ctx):
+        return list(COMMANDS)
+
+    def get_command(self, ctx, cmd_name):
+        if cmd_name not in COMMANDS:
+            return None
+        module, command, _ = COMMANDS[cmd_name]
+        return getattr(import_module(module), command)
+
+    def format_commands(self, ctx, formatter):
+        with formatter.section("Commands"):
+            formatter.write_dl([(name, short_help) for name, (_, _, short_help) in COMMANDS.items()])
+
+
+@click.group(cls=LazyGroup)
 def cli():
     """Convert stuff"""
     pass
-
-
-cli.add_command(yt_to_spotify.convert_yt_to_spotify)
-cli.add_command(export_spotify_playlist.export_spotify_playlist)
-cli.add_command(apmusic_to_spotify.convert_ap_to_spotify)
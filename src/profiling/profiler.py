@@ -0,0 +1,187 @@
+import json
+import threading
+import click
+from bisect import bisect_left
+from collections import Counter
+from time import perf_counter, time
+
+# upper bounds in ms of the latency histogram buckets, the last bucket holds everything slower
+LATENCY_BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+# youtube data api quota units per method, methods not listed cost 1 unit like every list call
+YOUTUBE_QUOTA_COSTS = {
+    "youtube.search.list": 100,
+    "youtube.playlists.insert": 50,
+    "youtube.playlists.update": 50,
+    "youtube.playlists.delete": 50,
+    "youtube.playlistItems.insert": 50,
+    "youtube.playlistItems.update": 50,
+    "youtube.playlistItems.delete": 50
+}
+
+# profiler of the running command, None unless --profile was given so the hooks cost one comparison
+ACTIVE = None
+
+
+class CallStats:
+    """
+    Counts, latencies and response sizes of one api endpoint
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.waited = 0.0
+        self.bytes = 0
+        self.latencies = []
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def add(self, seconds, waited, size, failed):
+        self.calls += 1
+        self.errors += failed
+        self.seconds += seconds
+        self.waited += waited
+        self.bytes += size
+        self.latencies.append(seconds)
+        self.histogram[bisect_left(LATENCY_BUCKETS, seconds * 1000)] += 1
+
+    def percentile(self, fraction):
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000 if ordered else 0.0
+
+
+def quota_cost(api, endpoint):
+    return YOUTUBE_QUOTA_COSTS.get(endpoint, 1) if api == "youtube" else 0
+
+
+class Profiler:
+    """
+    Stage timings, api call statistics and counters of one command run
+    Stages are sequential, mark() ends the current one and starts the next, a stage seen again adds up
+    With trace every api call is also kept as an event for dump()
+    """
+
+    def __init__(self, trace=False):
+        self.started = perf_counter()
+        self.total = None
+        self.stages = {}
+        self.calls = {}
+        self.counters = Counter()
+        self.events = [] if trace else None
+        self._stage = None
+        self._stage_started = None
+        self._lock = threading.Lock()
+
+    def mark(self, name):
+        now = perf_counter()
+        if self._stage is not None:
+            self.stages[self._stage] = self.stages.get(self._stage, 0.0) + now - self._stage_started
+        self._stage, self._stage_started = name, now
+
+    def record_call(self, api, endpoint, seconds, waited, result, error=None):
+        # size of the decoded json response, close to what came over the wire before compression
+        size = len(json.dumps(result)) if isinstance(result, (dict, list)) else 0
+        with self._lock:
+            self.calls.setdefault((api, endpoint), CallStats()).add(seconds, waited, size, error is not None)
+            if self.events is not None:
+                self.events.append({
+                    "time": time(),
+                    "stage": self._stage,
+                    "api": api,
+                    "endpoint": endpoint,
+                    "ms": round(seconds * 1000, 3),
+                    "waited_ms": round(waited * 1000, 3),
+                    "bytes": size,
+                    "error": None if error is None else repr(error)
+                })
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def finish(self):
+        self.mark(None)
+        self.total = perf_counter() - self.started
+
+    def report(self):
+        total = self.total or perf_counter() - self.started
+        lines = [f"{'Stage':<40}{'seconds':>10}{'share':>8}"]
+        for name, seconds in self.stages.items():
+            lines.append(f"{name:<40}{seconds:>10.2f}{seconds / total:>8.0%}")
+        lines.append(f"{'total':<40}{total:>10.2f}")
+
+        lines.append("")
+        lines.append(f"{'API call':<40}{'calls':>7}{'errors':>7}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}"
+                     f"{'KB':>9}{'waited s':>10}{'quota':>7}")
+        for (api, endpoint), stats in sorted(self.calls.items()):
+            lines.append(f"{api + ' ' + endpoint:<40}{stats.calls:>7}{stats.errors:>7}"
+                         f"{stats.percentile(0.5):>9.1f}{stats.percentile(0.95):>9.1f}"
+                         f"{max(stats.latencies) * 1000:>9.1f}{stats.bytes / 1024:>9.1f}{stats.waited:>10.2f}"
+                         f"{quota_cost(api, endpoint) * stats.calls:>7}")
+
+        hits, misses = self.counters['search cache hits'], self.counters['search cache misses']
+        if hits + misses:
+            lines.append(f"\nSearch cache hit rate {hits / (hits + misses):.0%} ({hits} hits, {misses} misses)")
+        for name, value in sorted(self.counters.items()):
+            if not name.startswith("search cache"):
+                lines.append(f"{name}: {value}")
+        return "\n".join(lines)
+
+    def dump(self, path):
+        with open(path, 'w', encoding="utf-8") as outp:
+            json.dump({
+                "total_seconds": self.total,
+                "stages": self.stages,
+                "latency_buckets_ms": LATENCY_BUCKETS,
+                "calls": [
+                    {
+                        "api": api,
+                        "endpoint": endpoint,
+                        "calls": stats.calls,
+                        "errors": stats.errors,
+                        "seconds": stats.seconds,
+                        "waited_seconds": stats.waited,
+                        "bytes": stats.bytes,
+                        "quota": quota_cost(api, endpoint) * stats.calls,
+                        "histogram": stats.histogram
+                    }
+                    for (api, endpoint), stats in sorted(self.calls.items())
+                ],
+                "counters": self.counters,
+                "events": self.events
+            }, outp, indent=4)
+
+
+def start(enabled, trace_file=None):
+    """
+    Starts profiling the running command when enabled or a trace file is given
+    """
+    global ACTIVE
+    ACTIVE = Profiler(trace=trace_file is not None) if enabled or trace_file else None
+    return ACTIVE
+
+
+def mark(name):
+    if ACTIVE is not None:
+        ACTIVE.mark(name)
+
+
+def count(name, amount=1):
+    if ACTIVE is not None:
+        ACTIVE.count(name, amount)
+
+
+def stop(trace_file=None):
+    """
+    Ends profiling, prints the summary table and writes the json trace when a trace file was given
+    """
+    global ACTIVE
+    if ACTIVE is None:
+        return
+    ACTIVE.finish()
+    click.echo("\n===============================")
+    click.echo(ACTIVE.report())
+    if trace_file:
+        ACTIVE.dump(trace_file)
+        click.echo(f"Trace written to {trace_file}")
+    ACTIVE = None
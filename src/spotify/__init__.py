@@ -1 +1 @@
-__all__ = ['create_spotify_client']
+__all__ = ['create_spotify_client', 'search_executor', 'search_cache', 'rate_limiter', 'token_provider']
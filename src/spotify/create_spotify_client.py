@@ -1,9 +1,37 @@
+import os
+import threading
 import spotipy
-from spotipy.oauth2 import SpotifyOAuth
+from src.spotify import rate_limiter, token_provider
 
+_clients = {}
+_clients_lock = threading.Lock()
 
-def create_spotify_client(client_id, client_secret):
-    return spotipy.Spotify(auth_manager=SpotifyOAuth(scope="user-library-read playlist-modify-private",
-                                                     client_id=client_id,
-                                                     client_secret=client_secret,
-                                                     redirect_uri='http://localhost'))
+
+def get_spotify(client_id, client_secret):
+    """
+    spotipy client of this process for client_id, on the shared token provider and session
+    Kept for the life of the process, spotipy closes its session when a client is garbage collected
+    """
+    with _clients_lock:
+        if (client_id, client_secret) not in _clients:
+            sp = spotipy.Spotify(auth_manager=token_provider.get_token_provider(client_id, client_secret),
+                                 requests_session=token_provider.shared_session())
+            # SPOTIFY_API_URL points the client at another Web API server, e.g. a local fake one for offline benchmarks
+            sp.prefix = os.environ.get("SPOTIFY_API_URL", sp.prefix)
+            _clients[client_id, client_secret] = sp
+        return _clients[client_id, client_secret]
+
+
+def create_spotify_client(client_id, client_secret, limiter=None):
+    return rate_limiter.RateLimitedClient(get_spotify(client_id, client_secret), limiter or rate_limiter.SPOTIFY)
+
+
+def _forget():
+    # a forked worker (convert-many) builds its own client on its own session
+    global _clients_lock
+    _clients.clear()
+    _clients_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget)
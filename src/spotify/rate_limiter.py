@@ -0,0 +1,225 @@
+import random
+import threading
+import multiprocessing
+from itertools import count
+from time import monotonic, perf_counter, sleep
+from src.profiling import profiler
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# default requests per second of the process wide limiters, the converters' --rate and --youtube-rate
+SPOTIFY_RATE = 20.0
+YOUTUBE_RATE = 10.0
+
+
+class TokenBucket:
+    """
+    Thread safe token bucket, acquire() blocks until a request may be sent
+    throttle() pauses every caller and halves the rate, each later success wins a little of it back
+    """
+
+    def __init__(self, rate, capacity=None, min_rate=None):
+        self.max_rate = rate
+        self.min_rate = min_rate or rate / 16
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = monotonic()
+                if now < self._blocked_until:
+                    wait = self._blocked_until - now
+                else:
+                    self._refill(now)
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return waited
+                    wait = (1 - self._tokens) / self.rate
+            sleep(wait)
+            waited += wait
+
+    def throttle(self, seconds):
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, monotonic() + seconds)
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = 0
+
+    def recover(self):
+        with self._lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+def _shared(index):
+    return property(lambda self: self._state[index],
+                    lambda self, value: self._state.__setitem__(index, value))
+
+
+class SharedTokenBucket(TokenBucket):
+    """
+    TokenBucket kept in shared memory, processes started with it (e.g. as a pool initializer argument) draw from
+    one budget and a throttle in any of them pauses all of them
+    """
+
+    rate = _shared(0)
+    _tokens = _shared(1)
+    _updated = _shared(2)
+    _blocked_until = _shared(3)
+
+    def __init__(self, rate, capacity=None, min_rate=None, context=None):
+        context = context or multiprocessing.get_context()
+        self.max_rate = rate
+        self.min_rate = min_rate or rate / 16
+        self.capacity = capacity or rate
+        self._state = context.RawArray('d', [rate, self.capacity, monotonic(), 0.0])
+        self._lock = context.Lock()
+
+
+def _error_status(error):
+    """
+    Status code and Retry-After of a spotipy SpotifyException or a googleapiclient HttpError, duck typed so
+    neither library has to be imported here
+    """
+    status = getattr(error, 'http_status', None)
+    headers = getattr(error, 'headers', None)
+    if status is None and getattr(error, 'resp', None) is not None:
+        status = getattr(error.resp, 'status', None)
+        headers = error.resp
+    retry_after = None
+    if headers:
+        try:
+            retry_after = float(headers.get('Retry-After', headers.get('retry-after')))
+        except (TypeError, ValueError):
+            pass
+    return status, retry_after
+
+
+class RateLimiter:
+    """
+    Shared limiter for one api: a token bucket that adapts to 429s and their Retry-After, jittered exponential
+    backoff for 429 and 5xx responses and an optional concurrency cap per endpoint
+    """
+
+    def __init__(self, rate, max_retries=6, base_delay=1.0, max_delay=60.0, endpoint_concurrency=None, bucket=None,
+                 name="api"):
+        self.name = name
+        self.bucket = bucket or TokenBucket(rate)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.endpoint_concurrency = endpoint_concurrency or {}
+        self._semaphores = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+        self.throttles = 0
+        # time held back by the bucket and backoff, summed over every waiting thread
+        self.throttled_seconds = 0.0
+        # wall clock time during which at least one thread was held back
+        self.throttled_wall_seconds = 0.0
+        self._waiting = 0
+        self._waiting_since = 0.0
+
+    def _semaphore(self, endpoint):
+        if endpoint not in self.endpoint_concurrency:
+            return None
+        with self._lock:
+            if endpoint not in self._semaphores:
+                self._semaphores[endpoint] = threading.BoundedSemaphore(self.endpoint_concurrency[endpoint])
+            return self._semaphores[endpoint]
+
+    def _wait(self, function, *args):
+        """
+        Runs a blocking wait (bucket or backoff) and adds the time no other thread was already waiting
+        to throttled_wall_seconds
+        """
+        with self._lock:
+            if self._waiting == 0:
+                self._waiting_since = monotonic()
+            self._waiting += 1
+        try:
+            return function(*args)
+        finally:
+            with self._lock:
+                self._waiting -= 1
+                if self._waiting == 0:
+                    self.throttled_wall_seconds += monotonic() - self._waiting_since
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def call(self, endpoint, function, *args, **kwargs):
+        semaphore = self._semaphore(endpoint)
+        for attempt in count():
+            waited = self._wait(self.bucket.acquire)
+            if semaphore:
+                semaphore.acquire()
+            started = perf_counter()
+            try:
+                result = function(*args, **kwargs)
+            except Exception as e:
+                if profiler.ACTIVE is not None:
+                    profiler.ACTIVE.record_call(self.name, endpoint, perf_counter() - started, waited, None, e)
+                status, retry_after = _error_status(e)
+                if status not in RETRY_STATUSES or attempt >= self.max_retries:
+                    raise
+            else:
+                if profiler.ACTIVE is not None:
+                    profiler.ACTIVE.record_call(self.name, endpoint, perf_counter() - started, waited, result)
+                self.bucket.recover()
+                with self._lock:
+                    self.calls += 1
+                    self.throttled_seconds += waited
+                return result
+            finally:
+                if semaphore:
+                    semaphore.release()
+
+            delay = min(self.max_delay, retry_after) if retry_after is not None else self._backoff(attempt)
+            if status == 429:
+                self.bucket.throttle(delay)
+            with self._lock:
+                self.retries += 1
+                self.throttles += status == 429
+                self.throttled_seconds += waited + delay
+            self._wait(sleep, delay)
+
+    def stats(self):
+        return (f"{self.calls} calls, {self.throttles} throttled, {self.retries} retried, "
+                f"{self.throttled_wall_seconds:.1f}s held back by rate limits "
+                f"({self.throttled_seconds:.1f}s summed over threads)")
+
+
+class RateLimitedClient:
+    """
+    Wraps an api client so every method call goes through a RateLimiter, the method name is the endpoint
+    """
+
+    def __init__(self, client, limiter):
+        self._client = client
+        self.limiter = limiter
+
+    def __getattr__(self, name):
+        attribute = getattr(self._client, name)
+        if not callable(attribute):
+            return attribute
+
+        def limited(*args, **kwargs):
+            return self.limiter.call(name, attribute, *args, **kwargs)
+
+        return limited
+
+
+# process wide limiters, every client of the same api shares one so parallel work stays under the quota together
+SPOTIFY = RateLimiter(SPOTIFY_RATE, endpoint_concurrency={"user_playlist_add_tracks": 1, "playlist_add_items": 1,
+                                              "playlist_remove_all_occurrences_of_items": 1}, name="spotify")
+YOUTUBE = RateLimiter(YOUTUBE_RATE, name="youtube")
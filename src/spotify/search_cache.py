@@ -0,0 +1,115 @@
+import os
+import json
+import sqlite3
+import threading
+from time import time
+from src.profiling import profiler
+from src.spotify import track_record
+
+DEFAULT_CACHE_DIR = ".analyzer-cache"
+DEFAULT_TTL = 60 * 60 * 24 * 30
+DEFAULT_MAX_ENTRIES = 200000
+
+
+def normalize_query(query):
+    return " ".join(query.lower().split())
+
+
+class SearchCache:
+    """
+    SQLite backed cache of sp.search responses keyed by normalized query,
+    expired after ttl seconds and trimmed least recently used first past max_entries
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._inserts = 0
+        self._db = sqlite3.connect(os.path.join(cache_dir, "spotify-search.sqlite3"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS search "
+            "(key TEXT PRIMARY KEY, response TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS search_accessed_at ON search (accessed_at)")
+        self._db.execute("DELETE FROM search WHERE created_at < ?", (time() - self.ttl,))
+        self._db.commit()
+
+    @staticmethod
+    def key(query, limit):
+        return f"{limit}:{normalize_query(query)}"
+
+    def get(self, query, limit=9):
+        key = self.key(query, limit)
+        with self._lock:
+            row = self._db.execute("SELECT response, created_at FROM search WHERE key = ?", (key,)).fetchone()
+            if row is None or row[1] + self.ttl < time():
+                self.misses += 1
+                profiler.count("search cache misses")
+                return None
+            self._db.execute("UPDATE search SET accessed_at = ? WHERE key = ?", (time(), key))
+            self._db.commit()
+            self.hits += 1
+            profiler.count("search cache hits")
+        return json.loads(row[0])
+
+    def put(self, query, response, limit=9):
+        now = time()
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO search VALUES (?, ?, ?, ?)",
+                             (self.key(query, limit), json.dumps(response), now, now))
+            self._inserts += 1
+            if self._inserts % 100 == 0:
+                self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        count = self._db.execute("SELECT COUNT(*) FROM search").fetchone()[0]
+        if count > self.max_entries:
+            self._db.execute(
+                "DELETE FROM search WHERE key IN (SELECT key FROM search ORDER BY accessed_at LIMIT ?)",
+                (count - self.max_entries,))
+
+    def search(self, sp, query, limit=9):
+        response = self.get(query, limit)
+        if response is None:
+            response = track_record.trim_response(sp.search(query, type="track", limit=limit))
+            self.put(query, response, limit)
+        return response
+
+    def stats(self):
+        return f"Search cache: {self.hits} hits, {self.misses} misses"
+
+    def close(self):
+        with self._lock:
+            self._evict()
+            self._db.commit()
+            self._db.close()
+
+
+class CachedSpotify:
+    """
+    Wraps a spotipy client so track searches go through a SearchCache, every other call is passed through
+    """
+
+    def __init__(self, sp, cache):
+        self._sp = sp
+        self.cache = cache
+
+    def search(self, q, limit=10, offset=0, type="track", market=None):
+        if type != "track" or offset or market:
+            return self._sp.search(q, limit=limit, offset=offset, type=type, market=market)
+        return self.cache.search(self._sp, q, limit)
+
+    def __getattr__(self, name):
+        return getattr(self._sp, name)
+
+
+def cached_client(sp, no_cache=False, cache_dir=DEFAULT_CACHE_DIR):
+    if no_cache:
+        return sp
+    return CachedSpotify(sp, SearchCache(cache_dir))
@@ -0,0 +1,25 @@
+from collections import deque
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from src.spotify import track_record
+
+
+def search_tracks(sp, queries, concurrency=8, limit=9, ahead=None):
+    """
+    Runs sp.search for every query on a bounded thread pool and yields the responses in input order
+    At most ahead searches (default 4 per thread) are sent past the response last taken, so a consumer that
+    stops taking responses stops the searches too
+    Tracks are trimmed and shared between responses (see track_record.trim_response)
+    """
+    interned = {}
+    queries = iter(queries)
+
+    def search(query):
+        return track_record.trim_response(sp.search(query, type="track", limit=limit), interned)
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        pending = deque(executor.submit(search, query) for query in islice(queries, ahead or 4 * max(1, concurrency)))
+        while pending:
+            response = pending.popleft().result()
+            pending.extend(executor.submit(search, query) for query in islice(queries, 1))
+            yield response
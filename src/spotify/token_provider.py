@@ -0,0 +1,166 @@
+import os
+import json
+import time
+import threading
+import click
+import requests
+import requests.adapters
+from urllib3.util.retry import Retry
+from spotipy.oauth2 import SpotifyOAuth
+from spotipy.cache_handler import CacheFileHandler
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+SCOPE = "user-library-read playlist-modify-private"
+TOKEN_FILE = ".cache"
+# a token is refreshed this long before it expires, so no request goes out with one about to lapse
+REFRESH_MARGIN = 300
+# connections kept alive per host, above every --concurrency default so searches never wait on or drop one
+POOL_SIZE = 32
+# 429s are left out of the retries (Retry-After included) so the rate limiter sees them and throttles every thread
+STATUS_FORCELIST = (500, 502, 503, 504)
+
+_session = None
+_providers = {}
+_lock = threading.Lock()
+
+
+class FileLock:
+    """
+    Exclusive lock on path across processes, entering blocks until it is free
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, 'a+')
+        if fcntl:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            return self
+        self._file.seek(0)
+        while True:
+            try:
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+                return self
+            except OSError:
+                # LK_LOCK gives up after 10 seconds, a login in another process can take longer
+                continue
+
+    def __exit__(self, *exc):
+        if fcntl:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        self._file.close()
+
+
+class AtomicCacheFileHandler(CacheFileHandler):
+    """
+    Token file handler that writes through a temporary file, a reader never sees a half written token
+    """
+
+    def save_token_to_cache(self, token_info):
+        tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding="utf-8") as outp:
+                # the spotipy 2.20 pinned in requirements.txt has no encoder_cls, later versions do
+                json.dump(token_info, outp, cls=getattr(self, 'encoder_cls', None))
+            os.chmod(tmp_path, 0o600)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            click.echo(f"Couldn't save the Spotify token to {self.cache_path}: {e}", err=True)
+
+
+class TokenProvider(SpotifyOAuth):
+    """
+    SpotifyOAuth that keeps the token in memory instead of reading the token file before every request, and
+    refreshes it REFRESH_MARGIN seconds ahead of expiry
+    Refreshes and logins run under a lock on the token file shared with other processes, whoever gets the lock
+    after a refresh picks the new token up from the file instead of refreshing (or logging in) again
+    """
+
+    def __init__(self, client_id, client_secret, session=None, cache_path=TOKEN_FILE):
+        super().__init__(client_id=client_id, client_secret=client_secret, redirect_uri='http://localhost',
+                         scope=SCOPE, requests_session=session or True,
+                         cache_handler=AtomicCacheFileHandler(cache_path))
+        self.token_info = None
+        self.refreshes = 0
+        self._lock = threading.Lock()
+        self._lock_path = f"{cache_path}.lock"
+
+    def _fresh(self, token_info):
+        return (token_info is not None and token_info.get('expires_at', 0) - time.time() > REFRESH_MARGIN
+                and self._is_scope_subset(self.scope, token_info.get('scope')))
+
+    def _renew(self):
+        with self._lock, FileLock(self._lock_path):
+            # another thread or process may have refreshed while this one waited for the lock
+            token_info = self.cache_handler.get_cached_token()
+            if self._fresh(token_info):
+                self.token_info = token_info
+            elif token_info and token_info.get('refresh_token') and \
+                    self._is_scope_subset(self.scope, token_info.get('scope')):
+                self.token_info = self.refresh_access_token(token_info['refresh_token'])
+                self.refreshes += 1
+            else:
+                super().get_access_token(as_dict=False, check_cache=False)
+                self.token_info = self.cache_handler.get_cached_token()
+            return self.token_info
+
+    def get_access_token(self, code=None, as_dict=False, check_cache=True):
+        token_info = self.token_info
+        if not self._fresh(token_info):
+            token_info = self._renew()
+        return token_info if as_dict else token_info['access_token']
+
+    def get_cached_token(self):
+        return self.token_info or self.cache_handler.get_cached_token()
+
+
+def shared_session():
+    """
+    requests session of this process, every Spotify client and token request goes through its keep-alive pool
+    Retries the same way spotipy's own session does
+    """
+    global _session
+    with _lock:
+        if _session is None:
+            retry = Retry(total=3, connect=None, read=False,
+                          allowed_methods=frozenset(['GET', 'POST', 'PUT', 'DELETE']),
+                          status=3, backoff_factor=0.3, status_forcelist=STATUS_FORCELIST,
+                          respect_retry_after_header=False)
+            adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE, max_retries=retry)
+            _session = requests.Session()
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+        return _session
+
+
+def get_token_provider(client_id, client_secret):
+    """
+    The token provider of this process for client_id, loading the token file once
+    """
+    session = shared_session()
+    with _lock:
+        if (client_id, client_secret) not in _providers:
+            _providers[client_id, client_secret] = TokenProvider(client_id, client_secret, session)
+        return _providers[client_id, client_secret]
+
+
+def _forget():
+    # a forked worker (convert-many) must not share the parent's sockets or a lock held at fork time
+    global _session, _lock
+    _session = None
+    _providers.clear()
+    _lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget)
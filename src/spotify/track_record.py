@@ -0,0 +1,33 @@
+def trim_track(track):
+    """
+    Keeps what the converters, review screens and exports read from a track object: id, name, first artist,
+    album name, duration and ISRC, in the same nested shape as the Web API so all of them work on it unchanged
+    Available markets, images and external urls make up most of a full track and are dropped
+    """
+    artists = track.get('artists') or []
+    isrc = (track.get('external_ids') or {}).get('isrc')
+    return {
+        "id": track['id'],
+        "name": track['name'],
+        "artists": [{"name": artists[0]['name']}] if artists else [],
+        "album": {"name": (track.get('album') or {}).get('name')},
+        "duration_ms": track.get('duration_ms'),
+        "external_ids": {"isrc": isrc} if isrc else {}
+    }
+
+
+def trim_response(response, interned=None):
+    """
+    sp.search track response with trimmed tracks
+    Given an interned dict (track id to trimmed track), a track that came up before is shared instead of copied,
+    so the candidates of many searches hold each track once, callers copy a track before changing it
+    """
+    tracks = []
+    for track in response['tracks']['items']:
+        if not track or not track.get('id'):
+            continue
+        if interned is None:
+            tracks.append(trim_track(track))
+        else:
+            tracks.append(interned.get(track['id']) or interned.setdefault(track['id'], trim_track(track)))
+    return {"tracks": {"items": tracks}}
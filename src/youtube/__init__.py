@@ -1 +1 @@
-__all__ = ['create_youtube_client']
+__all__ = ['create_youtube_client', 'etag_cache']
@@ -1,33 +1,94 @@
 import os
+import threading
 import google_auth_oauthlib.flow
+import google.auth.exceptions
+import google_auth_httplib2
+import google.auth.transport.requests
+import google.oauth2.credentials
 import googleapiclient.discovery
+import googleapiclient.discovery_cache
 import googleapiclient.errors
-import pickle
-from time import time
+import googleapiclient.http
+from src.spotify import rate_limiter, search_cache
+from src.youtube import etag_cache
 
+SCOPES = ["https://www.googleapis.com/auth/youtube.readonly"]
+TOKEN_FILE = "./.youtubetoken.json"
+# directory of the ETag cache the clients send conditional requests from, None turns it off
+CACHE_DIR = search_cache.DEFAULT_CACHE_DIR
 
-def build_youtube_client(secrets_file):
-    scopes = ["https://www.googleapis.com/auth/youtube.readonly"]
-    os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = "1"
+_clients = {}
+_caches = {}
+_clients_lock = threading.Lock()
 
-    # Get credentials and create an API client
-    flow = google_auth_oauthlib.flow.InstalledAppFlow.from_client_secrets_file(secrets_file, scopes)
-    youtube = googleapiclient.discovery.build("youtube", "v3", credentials=flow.run_console())
 
-    with open('./.youtubeapiclient.pkl', 'wb') as outp:
-        youtube.timestamp = time()
-        pickle.dump(youtube, outp, pickle.HIGHEST_PROTOCOL)
+def load_youtube_credentials(secrets_file):
+    credentials = None
+    if os.path.exists(TOKEN_FILE):
+        credentials = google.oauth2.credentials.Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
 
-    return youtube
+    if credentials and not credentials.valid and credentials.refresh_token:
+        try:
+            credentials.refresh(google.auth.transport.requests.Request())
+        except google.auth.exceptions.RefreshError:
+            credentials = None
+
+    if not credentials or not credentials.valid:
+        os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = "1"
+        flow = google_auth_oauthlib.flow.InstalledAppFlow.from_client_secrets_file(secrets_file, SCOPES)
+        credentials = flow.run_console()
+
+    with open(TOKEN_FILE, 'w') as outp:
+        outp.write(credentials.to_json())
+
+    return credentials
+
+
+def limited_request_builder(limiter):
+    """
+    HttpRequest class whose execute() goes through limiter, the api method id is the endpoint
+    """
+    class LimitedHttpRequest(googleapiclient.http.HttpRequest):
+        def execute(self, http=None, num_retries=0):
+            return limiter.call(self.methodId, super().execute, http=http, num_retries=num_retries)
+
+    return LimitedHttpRequest
+
+
+def build_youtube_client(secrets_file, limiter=None, cache=None):
+    credentials = load_youtube_credentials(secrets_file)
+    request_builder = limited_request_builder(limiter or rate_limiter.YOUTUBE)
+    http = google_auth_httplib2.AuthorizedHttp(credentials, http=googleapiclient.http.build_http())
+    if cache is not None:
+        http = etag_cache.EtagHttp(http, cache)
+
+    # YOUTUBE_API_URL points the client at another Data API server, e.g. a local fake one for offline benchmarks
+    client_options = {"api_endpoint": os.environ["YOUTUBE_API_URL"]} if os.environ.get("YOUTUBE_API_URL") else None
+
+    # the discovery document ships with googleapiclient, building from it skips the discovery request
+    document = googleapiclient.discovery_cache.get_static_doc("youtube", "v3")
+    if document is None:
+        return googleapiclient.discovery.build("youtube", "v3", http=http,
+                                               requestBuilder=request_builder, client_options=client_options)
+    return googleapiclient.discovery.build_from_document(document, http=http, requestBuilder=request_builder,
+                                                         client_options=client_options)
+
+
+def get_etag_cache():
+    """
+    The ETag cache of CACHE_DIR, shared by every client using it, None when caching is off
+    """
+    if CACHE_DIR is None:
+        return None
+    with _clients_lock:
+        if CACHE_DIR not in _caches:
+            _caches[CACHE_DIR] = etag_cache.EtagCache(CACHE_DIR)
+        return _caches[CACHE_DIR]
 
 
 def create_youtube_client(secrets_file):
-    if os.path.exists("./.youtubeapiclient.pkl"):
-        with open("./.youtubeapiclient.pkl", "rb") as inp:
-            obj = pickle.load(inp)
-            if obj.timestamp + 518400 > time():
-                return obj
-            else:
-                return build_youtube_client(secrets_file)
-    else:
-        return build_youtube_client(secrets_file)
+    cache = get_etag_cache()
+    with _clients_lock:
+        if (secrets_file, CACHE_DIR) not in _clients:
+            _clients[secrets_file, CACHE_DIR] = build_youtube_client(secrets_file, cache=cache)
+        return _clients[secrets_file, CACHE_DIR]
@@ -0,0 +1,92 @@
+import os
+import json
+import sqlite3
+import threading
+
+
+class EtagCache:
+    """
+    SQLite store of youtube data api GET responses with their ETag, and of normalized playlist snapshots keyed
+    by the etags of all the playlist's pages
+    """
+
+    def __init__(self, cache_dir):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.not_modified = 0
+        self.saved_units = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(cache_dir, "youtube-etag.sqlite3"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS response (uri TEXT PRIMARY KEY, etag TEXT NOT NULL, body BLOB NOT NULL)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS snapshot "
+            "(playlist_id TEXT PRIMARY KEY, etag TEXT NOT NULL, units INTEGER NOT NULL, items TEXT NOT NULL)")
+        self._db.commit()
+
+    def get(self, uri):
+        with self._lock:
+            return self._db.execute("SELECT etag, body FROM response WHERE uri = ?", (uri,)).fetchone()
+
+    def put(self, uri, etag, body):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO response VALUES (?, ?, ?)", (uri, etag, body))
+            self._db.commit()
+
+    def snapshot(self, playlist_id, etag):
+        """
+        Normalized items stored for playlist_id when its pages still have etags, else None
+        """
+        with self._lock:
+            row = self._db.execute("SELECT etag, units, items FROM snapshot WHERE playlist_id = ?",
+                                   (playlist_id,)).fetchone()
+        if row is None or row[0] != etag:
+            return None
+        # the pages were still fetched to compare their etags, the localized titles lookups were saved
+        self.saved_units += row[1]
+        return json.loads(row[2])
+
+    def put_snapshot(self, playlist_id, etag, units, items):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO snapshot VALUES (?, ?, ?, ?)",
+                             (playlist_id, etag, units, json.dumps(items, ensure_ascii=False)))
+            self._db.commit()
+
+    def stats(self):
+        return (f"YouTube cache: {self.not_modified} responses not modified, "
+                f"{self.saved_units} quota units saved by unchanged playlists")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class EtagHttp:
+    """
+    Wraps the authorized http object of the youtube client: GETs send If-None-Match with the stored ETag and a
+    304 is answered with the stored body, every other call is passed through
+    """
+
+    def __init__(self, http, cache):
+        self._http = http
+        self.cache = cache
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        if method != "GET":
+            return self._http.request(uri, method, body=body, headers=headers, **kwargs)
+
+        cached = self.cache.get(uri)
+        headers = dict(headers or {})
+        if cached:
+            headers['If-None-Match'] = cached[0]
+        resp, content = self._http.request(uri, method, body=body, headers=headers, **kwargs)
+        if resp.status == 304 and cached:
+            self.cache.not_modified += 1
+            resp.status = 200
+            return resp, cached[1]
+        if resp.status == 200 and resp.get('etag'):
+            self.cache.put(uri, resp['etag'], content)
+        return resp, content
+
+    def __getattr__(self, name):
+        return getattr(self._http, name)